@@ -1,8 +1,143 @@
+import functools
+import gzip
+import heapq
+import io
 import json
+import logging
 import os
+import random
+import string
+import time
 import boto3
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
+from botocore.config import Config
+from boto3.s3.transfer import TransferConfig
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from concurrent.futures import ThreadPoolExecutor
+
+# Structured, level-controlled logging instead of print; verbose lines are
+# suppressed (and their arguments never formatted) unless LOG_LEVEL allows them
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# Ingestion is best-effort: the Step Function continues whether or not the
+# document is indexed yet, so blocking the function to poll Kendra/Bedrock
+# status only burns billed idle time. The loops stay available behind this
+# flag for debugging or synchronous callers.
+WAIT_FOR_INGESTION = os.environ.get('WAIT_FOR_INGESTION', 'false').lower() == 'true'
+
+# orjson parses/serializes large payloads roughly twice as fast as the stdlib
+# and accepts bytes directly; fall back to stdlib json when it isn't bundled
+try:
+    import orjson
+
+    def json_loads(data):
+        """Parse JSON from str or bytes using orjson."""
+        return orjson.loads(data)
+
+    def json_dumps(obj, pretty=False):
+        """Serialize to a JSON string using orjson."""
+        return orjson.dumps(
+            obj, option=orjson.OPT_INDENT_2 if pretty else 0
+        ).decode('utf-8')
+except ImportError:
+    def json_loads(data):
+        """Parse JSON from str or bytes using the stdlib."""
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+    def json_dumps(obj, pretty=False):
+        """Serialize to a JSON string using the stdlib."""
+        return json.dumps(obj, indent=2 if pretty else None)
+
+# ijson lets large processed documents be scanned in one streaming pass
+# without materializing bytes + str + parse tree at once; optional, with the
+# full parse as fallback
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Objects below this size are parsed whole; streaming only pays off once the
+# intermediate copies start to dominate Lambda memory
+_STREAM_PARSE_MIN_BYTES = 4 * 1024 * 1024
+
+# Top-level text fields recognized by the extraction code, in priority order
+_STREAM_TEXT_FIELDS = (
+    'document_content.text_content',
+    'document_content',
+    'text_content',
+    'content',
+    'body',
+    'text',
+)
+
+# The same priority order as key paths, for the full-parse extractor
+_TEXT_KEY_PATHS = tuple(field.split('.') for field in _STREAM_TEXT_FIELDS)
+
+# Fallback fields probed only when none of the primary text fields matched;
+# an explicit list replaces the old whole-dict heuristic scan
+_FALLBACK_CONTENT_KEYS = ('extracted_text', 'description', 'raw_text', 'summary')
+_FALLBACK_NESTED_PATHS = (
+    ('data', 'text'),
+    ('payload', 'content'),
+    ('document', 'text'),
+    ('result', 'text'),
+)
+
+def _dig(obj, path):
+    """Follow a key path through nested dicts, returning None on any miss."""
+    for key in path:
+        if not isinstance(obj, dict) or key not in obj:
+            return None
+        obj = obj[key]
+    return obj
+
+def stream_extract_document(body):
+    """Stream-extract text content and scalar metadata from a processed document.
+
+    Walks the JSON once with ijson, keeping the highest-priority text field
+    seen and any top-level string metadata entries; 'metadata' is preferred
+    with 'document_metadata' as the fallback, matching the full-parse path.
+    The pass always runs to the end so metadata appearing after the text
+    field is not dropped. Returns (None, {}) when no recognized text field
+    is present (e.g. list-shaped documents), in which case the caller falls
+    back to a full parse.
+    """
+    ranks = {field: i for i, field in enumerate(_STREAM_TEXT_FIELDS)}
+    best_text = None
+    best_rank = len(_STREAM_TEXT_FIELDS)
+    metadata = {}
+    fallback_metadata = {}
+    try:
+        for prefix, event, value in ijson.parse(body):
+            if event != 'string':
+                continue
+            rank = ranks.get(prefix, -1)
+            if 0 <= rank < best_rank:
+                best_text, best_rank = value, rank
+            elif prefix.startswith('metadata.') and prefix.count('.') == 1:
+                metadata[prefix[len('metadata.'):]] = value
+            elif (prefix.startswith('document_metadata.')
+                    and prefix.count('.') == 1):
+                fallback_metadata[prefix[len('document_metadata.'):]] = value
+    except Exception as stream_error:
+        logger.error(f"Streaming parse failed, falling back to full parse: {str(stream_error)}")
+        return None, {}
+    return best_text, metadata or fallback_metadata
+
+# Shared botocore config: keep TCP connections alive so warm Lambda invocations
+# reuse the pooled TLS sessions instead of paying a new handshake per call.
+# Read timeout is left at the botocore default because Bedrock model
+# invocations can legitimately take minutes for long generations.
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=32,
+    retries={'mode': 'adaptive', 'max_attempts': 5}
+)
 
 # Initialize AWS clients
 def get_bedrock_clients():
@@ -12,25 +147,25 @@ def get_bedrock_clients():
 
     # Try to create the bedrock-agent client first
     try:
-        bedrock_agent_client = boto3.client('bedrock-agent')
-        print("Successfully created 'bedrock-agent' client")
+        bedrock_agent_client = boto3.client('bedrock-agent', config=BOTO_CONFIG)
+        logger.info("Successfully created 'bedrock-agent' client")
     except Exception as e:
-        print(f"Error creating bedrock-agent client: {str(e)}")
+        logger.error(f"Error creating bedrock-agent client: {str(e)}")
         try:
             # Fall back to bedrock client for regions that use this API instead
-            bedrock_client = boto3.client('bedrock')
+            bedrock_client = boto3.client('bedrock', config=BOTO_CONFIG)
             bedrock_agent_client = bedrock_client  # Use the same client for both
-            print("Using 'bedrock' client for agent functions")
+            logger.info("Using 'bedrock' client for agent functions")
         except Exception as e2:
-            print(f"Error creating bedrock client: {str(e2)}")
+            logger.error(f"Error creating bedrock client: {str(e2)}")
             raise Exception("Failed to create any Bedrock client")
 
     # Create the runtime client for model invocation
-    bedrock_runtime = boto3.client('bedrock-runtime')
+    bedrock_runtime = boto3.client('bedrock-runtime', config=BOTO_CONFIG)
 
     # Create the bedrock client for managing inference profiles
     if bedrock_client is None:
-        bedrock_client = boto3.client('bedrock')
+        bedrock_client = boto3.client('bedrock', config=BOTO_CONFIG)
 
     return bedrock_agent_client, bedrock_runtime, bedrock_client
 
@@ -38,7 +173,7 @@ def get_bedrock_clients():
 try:
     bedrock_agent, bedrock_runtime, bedrock_client = get_bedrock_clients()
 except Exception as e:
-    print(f"Failed to initialize Bedrock clients: {str(e)}")
+    logger.error(f"Failed to initialize Bedrock clients: {str(e)}")
     # Define fallback values that will cause explicit errors if used
     bedrock_agent = None
     bedrock_runtime = None
@@ -52,45 +187,134 @@ AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 CLAUDE_MODEL_ARN = f"arn:aws:bedrock:{AWS_REGION}::foundation-model/{CLAUDE_MODEL_ID}"
 INFERENCE_PROFILE_NAME = 'ClaudeInferenceProfile'
 
-# Function to get inference profile ARN from environment variable
+# Accepted Bedrock ARN prefixes, as a tuple so str.startswith does one
+# C-level check; extended here if partition-specific ARNs ever appear
+_VALID_ARN_PREFIXES = ('arn:aws:bedrock:',)
+
+# Path markers recognized by the profile-ARN validation
+_PROFILE_ARN_MARKERS = ('inference-profile/', 'application-inference-profile/')
+
+# Claude prompt template, compiled once at import; only the query, context and
+# image instruction vary per call
+PROMPT_TEMPLATE = (
+    "I have the following question: {query}\n\n"
+    "Here is some context that might help you answer:\n\n{context}\n\n{image_instruction}\n\n"
+    "Please provide a comprehensive answer based on the context provided. "
+    "If the context doesn't contain enough information to answer the question, "
+    "please say so. Include references to the sources in your answer."
+)
+
+# The Claude request envelope is identical on every call; only the prompt
+# text varies, so the surrounding JSON is prebuilt as bytes and per-call
+# serialization reduces to encoding the text itself
+_REQUEST_BODY_PREFIX = (
+    b'{"anthropic_version":"bedrock-2023-05-31","max_tokens":4000,'
+    b'"temperature":0.1,"messages":[{"role":"user","content":'
+    b'[{"type":"text","text":'
+)
+_REQUEST_BODY_SUFFIX = b'}]}]}'
+
+# Function to get inference profile ARN from environment variable; the env
+# var cannot change within a container's lifetime, so resolve it once
+@functools.lru_cache(maxsize=1)
 def get_inference_profile_arn():
     """Get the inference profile ARN from environment variable or use direct model ID."""
     # Check if inference profile ARN is provided as an environment variable
     inference_profile_arn = os.environ.get('CLAUDE_INFERENCE_PROFILE_ARN')
     if inference_profile_arn:
-        print(f"Using inference profile ARN from environment: {inference_profile_arn}")
-
-        # Validate that the ARN looks correct
-        if inference_profile_arn.startswith('arn:aws:bedrock:') and 'inference-profile' in inference_profile_arn:
+        logger.info(f"Using inference profile ARN from environment: {inference_profile_arn}")
+
+        # Validate that the ARN looks correct; both system-defined
+        # ('inference-profile/') and application inference profiles
+        # ('application-inference-profile/') are accepted without any
+        # per-call GetInferenceProfile lookup
+        if inference_profile_arn.startswith(_VALID_ARN_PREFIXES) and any(
+                marker in inference_profile_arn for marker in _PROFILE_ARN_MARKERS):
             return inference_profile_arn
         else:
-            print(f"Warning: Inference profile ARN format looks incorrect: {inference_profile_arn}")
+            logger.warning(f"Warning: Inference profile ARN format looks incorrect: {inference_profile_arn}")
             # Continue anyway as it might be a valid ARN in a different format
             return inference_profile_arn
 
     # If no ARN is provided, return None
-    print("No inference profile ARN found in environment variables")
+    logger.info("No inference profile ARN found in environment variables")
     return None
 
 # Function to create a direct model ARN
+@functools.lru_cache(maxsize=1)
 def get_model_arn():
     """Create a direct model ARN for Claude 3.5 Sonnet."""
     region = os.environ.get('AWS_REGION', 'us-east-1')
     return f"arn:aws:bedrock:{region}::foundation-model/{CLAUDE_MODEL_ID}"
 
+# Built once at import; get_content_type is called per ingested document
+_CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.pdf': 'application/pdf',
+    '.tiff': 'image/tiff',
+    '.tif': 'image/tiff'
+}
+
 def get_content_type(key):
     """Determine the content type based on file extension."""
-    ext = os.path.splitext(key.lower())[1]
-    content_types = {
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.png': 'image/png',
-        '.gif': 'image/gif',
-        '.pdf': 'application/pdf',
-        '.tiff': 'image/tiff',
-        '.tif': 'image/tiff'
-    }
-    return content_types.get(ext, 'application/octet-stream')
+    ext = key[key.rfind('.'):].lower() if '.' in key else ''
+    return _CONTENT_TYPES.get(ext, 'application/octet-stream')
+
+# Text-block templates, parsed once at import instead of per image
+_QA_BLOCK_TEMPLATE = ("Image {n} (Relevance Score: {score:.2f}):\n"
+                      "Question: {question}\nAnswer: {answer}")
+_IMG_BLOCK_TEMPLATE = "Image {n} (Relevance Score: {score:.2f}):\n{description}"
+
+def _iter_image_blocks(images):
+    """Yield the text and image blocks for each image with a valid URL."""
+    for i, img in enumerate(images):
+        if 'presigned_url' not in img:  # Only include images with valid URLs
+            continue
+
+        # Create the basic image block
+        image_block = {
+            'type': 'image',
+            'url': img['presigned_url'],
+            'description': img['description'],
+            'relevance_score': img['relevance_score'],
+            'rank': i + 1  # Add rank information (1-based)
+        }
+
+        # Add additional metadata if available
+        if 'pdf_page_uri' in img:
+            image_block['source_pdf'] = img['pdf_page_uri']
+
+        # Add Q&A information if available, with a text block describing the
+        # image emitted before the image block itself
+        if img.get('is_qa_image') and 'question' in img:
+            image_block['question'] = img['question']
+            image_block['answer'] = img['answer']
+            image_block['is_qa_image'] = True
+
+            yield {
+                'type': 'text',
+                'content': _QA_BLOCK_TEMPLATE.format_map({
+                    'n': i + 1,
+                    'score': img['relevance_score'],
+                    'question': img['question'],
+                    'answer': img['answer']
+                }),
+                'is_qa_content': True
+            }
+        else:
+            yield {
+                'type': 'text',
+                'content': _IMG_BLOCK_TEMPLATE.format_map({
+                    'n': i + 1,
+                    'score': img['relevance_score'],
+                    'description': img['description']
+                })
+            }
+
+        yield image_block
 
 def create_structured_response(answer, images):
     """Create a structured response with inline image references and Q&A information."""
@@ -98,114 +322,261 @@ def create_structured_response(answer, images):
     if not images:
         return [{'type': 'text', 'content': answer}]
 
-    # Create a structured response with text and image blocks
-    structured_response = []
-
-    # Add the text answer
-    structured_response.append({'type': 'text', 'content': answer})
-
-    # Add a text block explaining the images
-    if images:
-        image_intro = {
+    # Seed with the answer and image intro, then extend from the generator in
+    # one pass instead of growing the list append-by-append
+    structured_response = [
+        {'type': 'text', 'content': answer},
+        {
             'type': 'text',
             'content': f"Here are the top {len(images)} images relevant to your query, ranked by relevance score:"
         }
-        structured_response.append(image_intro)
+    ]
+    structured_response.extend(_iter_image_blocks(images))
 
-    # Add image blocks for relevant images
-    for i, img in enumerate(images):
-        if 'presigned_url' in img:  # Only include images with valid URLs
-            # Create the basic image block
-            image_block = {
-                'type': 'image',
-                'url': img['presigned_url'],
-                'description': img['description'],
-                'relevance_score': img['relevance_score'],
-                'rank': i + 1  # Add rank information (1-based)
-            }
+    return structured_response
 
-            # Add additional metadata if available
-            if 'pdf_page_uri' in img:
-                image_block['source_pdf'] = img['pdf_page_uri']
-
-            # Add Q&A information if available
-            if 'is_qa_image' in img and img['is_qa_image'] and 'question' in img:
-                image_block['question'] = img['question']
-                image_block['answer'] = img['answer']
-                image_block['is_qa_image'] = True
-
-                # Add a text block with the Q&A information before the image
-                qa_text_block = {
-                    'type': 'text',
-                    'content': f"Image {i+1} (Relevance Score: {img['relevance_score']:.2f}):\nQuestion: {img['question']}\nAnswer: {img['answer']}",
-                    'is_qa_content': True
-                }
-                structured_response.append(qa_text_block)
-            else:
-                # Add a text block with image information
-                image_text_block = {
-                    'type': 'text',
-                    'content': f"Image {i+1} (Relevance Score: {img['relevance_score']:.2f}):\n{img['description']}"
-                }
-                structured_response.append(image_text_block)
+# NumPy is optional: the batch scorer vectorizes over large candidate sets
+# when it is available and quietly falls back to the scalar loop when not
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-            # Add the image block after the text
-            structured_response.append(image_block)
+# Punctuation is trimmed from token edges so prose like "capacity?" still
+# matches the query term "capacity"; inner punctuation (hyphens, slashes)
+# is kept so compound tokens stay intact
+_TOKEN_TRIM_CHARS = string.punctuation
 
-    return structured_response
+def tokenize_lower(text_lower):
+    """Whole-word tokens of lowercased text with edge punctuation trimmed.
 
-def calculate_image_relevance(query_terms, index_value, index_type):
-    """Calculate a more sophisticated relevance score for an image."""
-    score = 0
-    matched_terms = set()
+    Must mirror the tokenization used when index_tokens is written by the
+    metadata extractor, or stored token sets stop matching query terms.
+    """
+    return [token for token in (raw.strip(_TOKEN_TRIM_CHARS)
+                                for raw in text_lower.split()) if token]
+
+# Per-index-type term weights: Q&A entries score highest, then direct image
+# text, then image content; section matches score lowest
+_INDEX_TYPE_WEIGHTS = {
+    'qa_image': 5,
+    'qa_pdf_page': 4,
+    'embedded_image': 3,
+    'image_content': 2
+}
+
+def calculate_image_relevance_batch(query_terms, index_values, index_types):
+    """Score many index values against the query terms in one pass.
+
+    Vectorizes the per-term matching with NumPy when it is available and the
+    candidate set is large enough to amortize array construction; otherwise
+    delegates to the scalar scorer. index_values must already be
+    lowercased. Returns parallel lists of scores and matched-term sets.
+    """
+    if np is None or len(index_values) < 32:
+        results = [calculate_image_relevance(query_terms, value, index_type)
+                   for value, index_type in zip(index_values, index_types)]
+        return [score for score, _ in results], [terms for _, terms in results]
+
+    # Normalize each document to its single-space-joined trimmed tokens, so
+    # the padded substring matches below agree exactly with the scalar
+    # scorer's token-set intersections
+    token_lists = [tokenize_lower(value) for value in index_values]
+    docs = np.array([f" {' '.join(tokens)} " for tokens in token_lists])
+    weights = np.array(
+        [_INDEX_TYPE_WEIGHTS.get(index_type, 1) for index_type in index_types],
+        dtype=float
+    )
+    scores = np.zeros(len(index_values), dtype=float)
+    matched_sets = [set() for _ in index_values]
 
-    # Base score from term matches
     for term in query_terms:
-        if term in index_value.lower():
-            # Weight based on index type
-            if index_type == 'embedded_image':
-                score += 3  # Higher weight for direct image text
-            elif index_type == 'image_content':
-                score += 2  # Medium weight for image content
-            else:
-                score += 1  # Lower weight for section matches
-
-            matched_terms.add(term)
+        # Unique-term counting mirrors the scalar set intersection
+        hits = np.char.find(docs, f" {term} ") >= 0
+        scores += hits * weights
+        for idx in np.nonzero(hits)[0]:
+            matched_sets[int(idx)].add(term)
+
+    # Term-density boost over the same token counts the scalar scorer uses
+    token_counts = np.array([len(tokens) for tokens in token_lists], dtype=float)
+    matched_counts = np.array([len(terms) for terms in matched_sets], dtype=float)
+    scores += np.where(token_counts > 0,
+                       matched_counts / (token_counts + 1) * 5, 0.0)
+
+    # Consecutive-match boost mirrors find_consecutive_matches, including
+    # the scalar path's matched-terms gate
+    query_phrase = ' '.join(query_terms)
+    if query_phrase:
+        phrase_hits = ((np.char.find(docs, query_phrase) >= 0)
+                       & (matched_counts >= min(2, len(query_terms))))
+        scores += phrase_hits * (len(query_terms) * 2)
 
-    # Boost score based on term density
-    if len(index_value) > 0:
-        term_density = len(matched_terms) / (len(index_value.split()) + 1)
-        score += term_density * 5
+    return scores.tolist(), matched_sets
 
-    # Boost score based on consecutive term matches
-    consecutive_matches = find_consecutive_matches(query_terms, index_value.lower())
-    score += consecutive_matches * 2
+def find_consecutive_matches(query_phrase, text, n_terms):
+    """Count a consecutive match of the full query phrase in text.
 
-    return score, matched_terms
-
-def find_consecutive_matches(query_terms, text):
-    """Find consecutive term matches in text."""
-    consecutive_count = 0
-    query_phrase = ' '.join(query_terms)
+    The caller joins the query terms once per request instead of per image.
+    """
+    if not query_phrase or query_phrase not in text:
+        return 0
+    return n_terms
 
-    if query_phrase in text:
-        consecutive_count += len(query_terms)
+s3_client = boto3.client('s3', config=BOTO_CONFIG)
 
-    return consecutive_count
+# S3 Select is unavailable to accounts onboarded since mid-2024; the first
+# failed attempt latches this flag so warm invocations go straight to
+# GetObject instead of paying a doomed Select round trip per payload.
+# Deployments that know they lack Select can also set DISABLE_S3_SELECT.
+_S3_SELECT_DISABLED = os.environ.get('DISABLE_S3_SELECT', 'false').lower() == 'true'
 
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+# DynamoDB reads go through DAX for microsecond cache hits when a cluster
+# endpoint is configured and the client library is bundled; otherwise the
+# plain resource is used. Table handles from either are API-compatible.
+try:
+    import amazondax
+except ImportError:
+    amazondax = None
+
+_DAX_ENDPOINT = os.environ.get('DAX_ENDPOINT')
+if amazondax is not None and _DAX_ENDPOINT:
+    dynamodb = amazondax.AmazonDaxClient.resource(endpoint_url=_DAX_ENDPOINT)
+else:
+    dynamodb = boto3.resource('dynamodb', config=BOTO_CONFIG)
+
+# Kendra client shared across invocations; a failed import-time init falls
+# back to lazy creation on first use rather than killing the module
+try:
+    kendra_client = boto3.client('kendra', config=BOTO_CONFIG)
+except Exception as kendra_init_error:
+    logger.error(f"Deferring Kendra client initialization: {str(kendra_init_error)}")
+    kendra_client = None
+
+def get_kendra_client():
+    """Return the shared Kendra client, creating it on first use if needed."""
+    global kendra_client
+    if kendra_client is None:
+        kendra_client = boto3.client('kendra', config=BOTO_CONFIG)
+    return kendra_client
+
+# Shared executor for overlapping independent AWS calls; boto3 clients are
+# thread-safe for independent requests
+_EXEC = ThreadPoolExecutor(max_workers=4)
+
+# Low-level DynamoDB client for hot-path reads: it skips the resource layer's
+# per-call marshalling machinery; items are decoded with one shared deserializer
+dynamodb_client = boto3.client('dynamodb', config=BOTO_CONFIG)
+_ddb_deserializer = TypeDeserializer()
+
+def deserialize_ddb_item(item):
+    """Convert a low-level DynamoDB item into a plain dict."""
+    return {key: _ddb_deserializer.deserialize(value) for key, value in item.items()}
+
+@functools.lru_cache(maxsize=4096)
+def _presign_get_object_cached(bucket, key, expires_in, expiry_bucket):
+    """Sign one GET URL; expiry_bucket rotates the cache entry over time."""
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': bucket,
+            'Key': key
+        },
+        ExpiresIn=expires_in
+    )
+
+def presign_get_object(bucket, key, expires_in=60):
+    """Generate a presigned GET URL using the shared module-level S3 client.
+
+    Routing every presign through the one client means botocore's signer and
+    endpoint-resolver state is built once per container and reused. Signed
+    URLs are additionally cached per (bucket, key) in time windows of half
+    the expiry, so repeat queries for the same objects skip the signing and
+    endpoint-resolution work while every served URL keeps at least half its
+    lifetime remaining.
+    """
+    expiry_bucket = int(time.time() // max(1, expires_in // 2))
+    return _presign_get_object_cached(bucket, key, expires_in, expiry_bucket)
+
+# Cached KNOWLEDGE_BASE_CONFIG items, reused across warm invocations. The
+# config is written once when the knowledge base is created and effectively
+# immutable afterwards, so a short TTL is safe.
+_KB_CONFIG_CACHE = {'items': None, 'ts': 0.0}
+_KB_CONFIG_TTL_SECONDS = 300
+
+# document_id -> metadata item primary key ('id'), cached per container so
+# repeat ingests can update status without the GSI lookup first
+_DOC_ID_PK_CACHE = {}
+
+# Kendra document IDs may only contain alphanumerics. A str.translate table
+# does the substitution in one C-level pass with no regex machinery; the
+# __missing__ hook keeps the table small while still catching any codepoint.
+_DOC_ID_ALLOWED = frozenset(string.ascii_letters + string.digits)
+
+class _DocIdTable(dict):
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        result = char if char in _DOC_ID_ALLOWED else '_'
+        self[codepoint] = result
+        return result
+
+_DOC_ID_XLATE = _DocIdTable()
+
+def sanitize_doc_id(doc_id):
+    """Replace non-alphanumeric characters with '_', collapsing runs."""
+    return '_'.join(filter(None, doc_id.translate(_DOC_ID_XLATE).split('_')))
+
+def get_kb_config_items(table):
+    """Get the KNOWLEDGE_BASE_CONFIG items, cached across warm invocations."""
+    if _KB_CONFIG_CACHE['items'] and time.time() - _KB_CONFIG_CACHE['ts'] < _KB_CONFIG_TTL_SECONDS:
+        return _KB_CONFIG_CACHE['items']
+
+    response = dynamodb_client.query(
+        TableName=table.name,
+        IndexName='DocumentIdIndex',
+        KeyConditionExpression='document_id = :did',
+        ExpressionAttributeValues={
+            ':did': {'S': 'KNOWLEDGE_BASE_CONFIG'}
+        },
+        # Only one config row exists; Limit lets DynamoDB stop reading
+        # as soon as it is found
+        Limit=1
+    )
+    items = [deserialize_ddb_item(item) for item in response['Items']]
+    if items:
+        _KB_CONFIG_CACHE['items'] = items
+        _KB_CONFIG_CACHE['ts'] = time.time()
+    return items
+
+# Table handles are cheap but not free to construct (schema metadata and
+# event wiring); memoize them per name for the container's lifetime
+@functools.lru_cache(maxsize=None)
+def get_table(table_name):
+    """Return a memoized DynamoDB Table handle for the given table name."""
+    return dynamodb.Table(table_name)
+
+# Best-effort warm-up at init: prefetch the KB config so provisioned-
+# concurrency instances come up with the cache populated and the DynamoDB
+# DNS/TLS path already established. Failures here must never break import.
+try:
+    if os.environ.get('METADATA_TABLE_NAME'):
+        get_kb_config_items(get_table(os.environ['METADATA_TABLE_NAME']))
+except Exception as init_error:
+    logger.error(f"Init-time KB config prefetch skipped: {str(init_error)}")
 
 def lambda_handler(event, context):
     """Lambda function to create and manage Bedrock knowledge base."""
-    print(f"Received event: {json.dumps(event)}")
+    # Never serialize the full event on the hot path; it can be huge. The
+    # top-level keys and operation are enough to trace an invocation.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Received event: keys=%s operation=%s",
+                     list(event.keys()), event.get('operation'))
 
     # Get the operation from the event
     operation = event.get('operation', 'create_knowledge_base')
 
     # Check if the previous step had an error
     if 'statusCode' in event and event['statusCode'] >= 400:
-        print(f"Received error from previous step: {event.get('error', event.get('body', 'Unknown error'))}")
+        logger.error(f"Received error from previous step: {event.get('error', event.get('body', 'Unknown error'))}")
         # Pass through the error but ensure we have the necessary fields for the next step
         return {
             'statusCode': event['statusCode'],
@@ -245,11 +616,11 @@ def create_knowledge_base(event):
 
         # Create the knowledge base
         try:
-            print(f"Attempting to create knowledge base: {kb_name}")
+            logger.info(f"Attempting to create knowledge base: {kb_name}")
             # Get the Kendra index ID
             kendra_index_id = os.environ.get('KENDRA_INDEX_ID')
             if not kendra_index_id:
-                print("KENDRA_INDEX_ID environment variable not set")
+                logger.info("KENDRA_INDEX_ID environment variable not set")
                 return {
                     'statusCode': 500,
                     'body': json.dumps('KENDRA_INDEX_ID environment variable not set')
@@ -267,16 +638,25 @@ def create_knowledge_base(event):
                 }
             )
         except Exception as kb_error:
-            print(f"Error in create_knowledge_base call: {str(kb_error)}")
+            logger.error(f"Error in create_knowledge_base call: {str(kb_error)}")
             raise kb_error
 
         # Get the knowledge base ID
         kb_id = response['knowledgeBase']['knowledgeBaseId']
-        print(f"Created knowledge base with ID: {kb_id}")
+        logger.info(f"Created knowledge base with ID: {kb_id}")
 
         # Create a data source for the knowledge base
         try:
-            print(f"Creating data source for knowledge base: {kb_id}")
+            logger.info(f"Creating data source for knowledge base: {kb_id}")
+            # Inclusion prefixes bound how much of the bucket every ingestion
+            # job re-scans; deployments that partition the processed bucket
+            # can narrow them via KB_INCLUSION_PREFIXES (comma-separated)
+            inclusion_prefixes = [
+                prefix for prefix in
+                os.environ.get('KB_INCLUSION_PREFIXES', 'Smart,processed_').split(',')
+                if prefix
+            ]
+
             data_source_response = bedrock_agent.create_data_source(
                 knowledgeBaseId=kb_id,
                 name=f"{kb_name}DataSource",
@@ -285,7 +665,7 @@ def create_knowledge_base(event):
                     'type': 'S3',
                     's3Configuration': {
                         'bucketArn': f"arn:aws:s3:::{processed_bucket}",
-                        'inclusionPrefixes': ['Smart', 'processed_']  # Include objects with common prefixes
+                        'inclusionPrefixes': inclusion_prefixes  # Include objects with common prefixes
                     }
                 },
                 vectorIngestionConfiguration={
@@ -299,7 +679,7 @@ def create_knowledge_base(event):
                 }
             )
         except Exception as ds_error:
-            print(f"Error in create_data_source call: {str(ds_error)}")
+            logger.error(f"Error in create_data_source call: {str(ds_error)}")
             raise ds_error
 
         # Get the data source ID
@@ -307,15 +687,16 @@ def create_knowledge_base(event):
 
         # Store the knowledge base and data source IDs in DynamoDB
         table_name = os.environ.get('METADATA_TABLE_NAME')
-        table = dynamodb.Table(table_name)
+        table = get_table(table_name)
 
+        now_iso = datetime.now(timezone.utc).isoformat()
         table.put_item(Item={
             'id': str(uuid.uuid4()),
             'document_id': 'KNOWLEDGE_BASE_CONFIG',
             'knowledge_base_id': kb_id,
             'data_source_id': ds_id,
-            'created_at': datetime.now().isoformat(),
-            'updated_at': datetime.now().isoformat(),
+            'created_at': now_iso,
+            'updated_at': now_iso,
             'status': 'CREATED'
         })
 
@@ -329,7 +710,7 @@ def create_knowledge_base(event):
         }
 
     except Exception as e:
-        print(f"Error creating knowledge base: {str(e)}")
+        logger.error(f"Error creating knowledge base: {str(e)}")
         return {
             'statusCode': 500,
             'body': json.dumps({
@@ -337,6 +718,329 @@ def create_knowledge_base(event):
             })
         }
 
+# Ranged-GET fan-out for large objects: one S3 stream tops out around
+# 50MB/s per connection, while parallel 1MB ranges can saturate the
+# function's bandwidth
+_RANGED_GET_MIN_BYTES = 8 * 1024 * 1024
+_RANGED_GET_PART_BYTES = 1024 * 1024
+
+def fetch_object_bytes(bucket, key, content_length):
+    """Download an object's bytes, fanning out ranged GETs when it is large.
+
+    Parts are written straight into a preallocated buffer through a
+    memoryview, so no intermediate concatenation copies are made.
+    """
+    if content_length < _RANGED_GET_MIN_BYTES:
+        return s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+    buf = bytearray(content_length)
+    view = memoryview(buf)
+
+    def _fetch_range(offset):
+        end = min(offset + _RANGED_GET_PART_BYTES, content_length) - 1
+        part = s3_client.get_object(
+            Bucket=bucket, Key=key, Range=f'bytes={offset}-{end}'
+        )['Body'].read()
+        view[offset:offset + len(part)] = part
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(_fetch_range, range(0, content_length, _RANGED_GET_PART_BYTES)))
+    return bytes(buf)
+
+# Mirror image of the ranged GET: bodies past the same 8MB threshold go up
+# as concurrent multipart parts instead of one single-stream PUT.
+_MULTIPART_CONFIG = TransferConfig(
+    multipart_threshold=_RANGED_GET_MIN_BYTES,
+    multipart_chunksize=_RANGED_GET_MIN_BYTES,
+    max_concurrency=8
+)
+
+def put_object_bytes(upload):
+    """Upload one S3 object, switching to multipart for large bodies.
+
+    ``upload`` is a dict of PutObject kwargs (Bucket/Key/Body/ContentType);
+    str bodies are encoded to UTF-8 first.
+    """
+    body = upload['Body']
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if len(body) < _MULTIPART_CONFIG.multipart_threshold:
+        s3_client.put_object(**dict(upload, Body=body))
+        return
+    s3_client.upload_fileobj(
+        io.BytesIO(body),
+        upload['Bucket'],
+        upload['Key'],
+        Config=_MULTIPART_CONFIG,
+        ExtraArgs={'ContentType': upload['ContentType']}
+    )
+
+def put_json_payload(bucket, key, serialized):
+    """Store a serialized JSON payload gzip-compressed in S3.
+
+    JSON compresses well, so the PUT ships a fraction of the bytes;
+    ContentEncoding marks the object so readers can decompress, and
+    upload_fileobj switches to multipart for very large payloads.
+    """
+    compressed = gzip.compress(serialized.encode('utf-8'), compresslevel=3)
+    s3_client.upload_fileobj(
+        io.BytesIO(compressed),
+        bucket,
+        key,
+        Config=_MULTIPART_CONFIG,
+        ExtraArgs={
+            'ContentType': 'application/json',
+            'ContentEncoding': 'gzip'
+        }
+    )
+
+def fetch_and_extract_text(bucket, key, s3_response=None):
+    """Fetch a processed document from S3 and extract its text and metadata.
+
+    Returns (text_content, metadata, text_is_verbatim); text_is_verbatim
+    means the body was plain text and is byte-identical to the source
+    object, so callers may server-side copy it instead of re-uploading.
+    """
+    if s3_response is None:
+        s3_response = s3_client.get_object(Bucket=bucket, Key=key)
+
+    # When the processed artifact is already plain text its body is used
+    # verbatim, and any data-source upload can become a server-side copy
+    # instead of a re-upload
+    text_is_verbatim = (
+        s3_response.get('ContentType', '').startswith('text/plain')
+        or key.endswith('.txt')
+    )
+
+    # For large documents, stream-extract just the fields we
+    # use instead of holding the whole parse tree in memory
+    document_json = None
+    streamed_text = None
+    streamed_metadata = {}
+    if text_is_verbatim:
+        streamed_text = s3_response['Body'].read().decode('utf-8')
+    elif ijson is not None and s3_response.get('ContentLength', 0) > _STREAM_PARSE_MIN_BYTES:
+        streamed_text, streamed_metadata = stream_extract_document(s3_response['Body'])
+        if streamed_text is None and s3_response.get('ContentLength', 0) < _RANGED_GET_MIN_BYTES:
+            # Unrecognized shape; re-fetch for the full parse below (larger
+            # objects go through the ranged-GET fan-out instead)
+            s3_response = s3_client.get_object(Bucket=bucket, Key=key)
+    if streamed_text is None:
+        content_length = s3_response.get('ContentLength', 0)
+        if content_length >= _RANGED_GET_MIN_BYTES:
+            document_content = fetch_object_bytes(bucket, key, content_length).decode('utf-8')
+        else:
+            document_content = s3_response['Body'].read().decode('utf-8')
+        document_json = json_loads(document_content)
+
+    # Extract text content from the processed document
+    text_content = streamed_text or ""
+
+    # Print the document JSON structure to help debug
+    if isinstance(document_json, dict):
+        logger.info(f"Document JSON keys: {list(document_json.keys())}")
+    elif isinstance(document_json, list):
+        logger.info(f"Document JSON is a list with {len(document_json)} items")
+        if document_json and isinstance(document_json[0], dict):
+            logger.info(f"First item keys: {list(document_json[0].keys())}")
+    elif document_json is not None:
+        logger.info(f"Document JSON is of type: {type(document_json)}")
+
+    # Handle different document_json structures
+    if isinstance(document_json, dict):
+        # Walk the known key paths in priority order instead of
+        # a branch per field
+        for path in _TEXT_KEY_PATHS:
+            value = _dig(document_json, path)
+            if isinstance(value, str) and value:
+                text_content = value
+                logger.info(f"Found {'.'.join(path)} field with length: {len(text_content)}")
+                break
+    elif isinstance(document_json, list):
+        # If it's a list, try to extract text from each item
+        logger.info("Document JSON is a list, extracting text from items")
+        combined_text = []
+
+        for idx, item in enumerate(document_json):
+            if isinstance(item, dict):
+                # Try to extract text from common fields with one lookup each
+                item_text = (item.get('text_content')
+                             or item.get('ai_generated_description')
+                             or item.get('description')
+                             or item.get('text')
+                             or "")
+
+                if item_text:
+                    combined_text.append(f"Item {idx+1}: {item_text}")
+                    logger.info(f"Extracted text from item {idx+1} with length: {len(item_text)}")
+            elif isinstance(item, str):
+                combined_text.append(item)
+                logger.info(f"Added string item {idx+1} with length: {len(item)}")
+
+        if combined_text:
+            text_content = "\n\n".join(combined_text)
+            logger.info(f"Combined text from {len(combined_text)} items, total length: {len(text_content)}")
+        else:
+            # If we couldn't extract text from items, use the JSON representation
+            text_content = json_dumps(document_json, pretty=True)
+            logger.info(f"No text extracted from list items, using JSON representation with length: {len(text_content)}")
+
+    # If we still don't have content, probe the known fallback
+    # fields instead of scanning every key in the document
+    if not text_content and isinstance(document_json, dict):
+        for field in _FALLBACK_CONTENT_KEYS:
+            value = document_json.get(field)
+            if isinstance(value, str) and len(value) > 100:  # Assume large string fields are content
+                text_content = value
+                logger.info(f"Found potential content in field '{field}' with length: {len(text_content)}")
+                break
+        if not text_content:
+            for path in _FALLBACK_NESTED_PATHS:
+                value = _dig(document_json, path)
+                if isinstance(value, str) and len(value) > 100:
+                    text_content = value
+                    logger.info(f"Found potential content in nested field '{'.'.join(path)}' with length: {len(text_content)}")
+                    break
+
+    # If we still don't have content, dump the entire JSON as text. A body
+    # that parsed to a bare string is already the content; skip the
+    # re-serialization pass for it.
+    if not text_content:
+        if isinstance(document_json, str):
+            text_content = document_json
+            logger.info(f"Document body is a plain JSON string, using it directly with length: {len(text_content)}")
+        else:
+            logger.info("No content field found. Using the entire JSON as content.")
+            text_content = json_dumps(document_json, pretty=True)
+            logger.info(f"Generated content from full JSON with length: {len(text_content)}")
+
+    # Extract any metadata from the document; the streaming
+    # fast path collects it in the same pass
+    metadata = streamed_metadata or {}
+    if isinstance(document_json, dict):
+        # Extract metadata fields if they exist
+        candidate = document_json.get('metadata') or document_json.get('document_metadata')
+        if isinstance(candidate, dict):
+            metadata = candidate
+    elif isinstance(document_json, list) and document_json:
+        # If it's a list, try to extract metadata from the first item
+        first_item = document_json[0]
+        if isinstance(first_item, dict):
+            candidate = first_item.get('metadata') or first_item.get('document_metadata')
+            if isinstance(candidate, dict):
+                metadata = candidate
+
+        # Add some metadata about the list itself
+        metadata['item_count'] = str(len(document_json))
+        metadata['document_type'] = 'image_descriptions'
+
+    return text_content, metadata, text_is_verbatim
+
+def add_documents_to_knowledge_base(event, documents):
+    """Add a batch of documents to the Kendra index in one pass.
+
+    Extraction runs in parallel, documents go out in BatchPutDocument calls
+    of up to 10 (the Kendra limit) with no per-document sync job, and one
+    backoff poll covers all statuses. Upstream states fan in by passing a
+    'documents' list of per-document events.
+    """
+    try:
+        kendra_index_id = os.environ.get('KENDRA_INDEX_ID')
+        if not kendra_index_id:
+            return {
+                'statusCode': 500,
+                'body': json.dumps('KENDRA_INDEX_ID environment variable not set')
+            }
+
+        kendra = get_kendra_client()
+
+        def _prepare(doc_event):
+            bucket = doc_event.get('processed_bucket')
+            key = doc_event.get('processed_key')
+            text_content, metadata, _ = fetch_and_extract_text(bucket, key)
+
+            document_id = doc_event.get(
+                'document_id', os.path.splitext(os.path.basename(key))[0])
+            base_doc_id = document_id.rsplit('.', 1)[0] if '.' in document_id else document_id
+            clean_doc_id = (f"{sanitize_doc_id(base_doc_id)}_"
+                            f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}")
+
+            document = {
+                'Id': clean_doc_id,
+                'Title': clean_doc_id,
+                'ContentType': 'PLAIN_TEXT',
+                'Blob': text_content
+            }
+            attributes = [
+                {'Key': meta_key, 'Value': {'StringValue': value}}
+                for meta_key, value in metadata.items() if isinstance(value, str)
+            ]
+            if attributes:
+                document['Attributes'] = attributes
+            return document
+
+        prepared = list(_EXEC.map(_prepare, documents))
+
+        # Kendra accepts at most 10 documents per BatchPutDocument call
+        failed = []
+        for start in range(0, len(prepared), 10):
+            batch = prepared[start:start + 10]
+            batch_response = kendra.batch_put_document(
+                IndexId=kendra_index_id,
+                Documents=batch
+            )
+            failed.extend(batch_response.get('FailedDocuments', []))
+        for failure in failed:
+            logger.error(f"Document failed BatchPutDocument: {failure}")
+
+        # One backoff loop polls every document's status together; like the
+        # single-document paths, polling is observability only and skipped
+        # unless a synchronous caller explicitly asks to wait
+        doc_ids = [doc['Id'] for doc in prepared]
+        pending = set(doc_ids) - {failure.get('Id') for failure in failed}
+        if not WAIT_FOR_INGESTION:
+            logger.info("WAIT_FOR_INGESTION disabled; returning without polling batch document status")
+        else:
+            max_wait_time = 300
+            start_time = time.time()
+            attempt = 0
+            while pending and (time.time() - start_time) < max_wait_time:
+                for start in range(0, len(doc_ids), 10):
+                    chunk = [d for d in doc_ids[start:start + 10] if d in pending]
+                    if not chunk:
+                        continue
+                    status_response = kendra.batch_get_document_status(
+                        IndexId=kendra_index_id,
+                        DocumentInfoList=[{'DocumentId': doc_id} for doc_id in chunk]
+                    )
+                    for doc_status in status_response.get('DocumentStatusList', []):
+                        status = doc_status.get('Status', 'Unknown')
+                        if status == 'INDEXED':
+                            pending.discard(doc_status.get('DocumentId'))
+                        elif status in ['FAILED', 'ERROR']:
+                            logger.error(f"Document indexing failed: {doc_status}")
+                            pending.discard(doc_status.get('DocumentId'))
+                if pending:
+                    attempt += 1
+                    time.sleep(min(30, 2 ** attempt + random.uniform(0, 1)))
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': f'Processed {len(prepared)} documents',
+                'document_ids': doc_ids,
+                'failed_count': len(failed),
+                'pending_count': len(pending)
+            })
+        }
+
+    except Exception as e:
+        logger.error(f"Error adding documents to knowledge base: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps(f'Error adding documents to knowledge base: {str(e)}')
+        }
+
 def add_document_to_knowledge_base(event):
     """Add a document to the Bedrock knowledge base."""
     if bedrock_agent is None:
@@ -345,37 +1049,85 @@ def add_document_to_knowledge_base(event):
             'body': json.dumps('Bedrock clients not properly initialized')
         }
 
+    # Fan-in path: a 'documents' list is ingested as one batched pass
+    documents = event.get('documents')
+    if documents:
+        return add_documents_to_knowledge_base(event, documents)
+
     try:
         # Get the document information directly from the event
         processed_bucket = event.get('processed_bucket')
         processed_key = event.get('processed_key')
 
+        # Kick off the knowledge base configuration lookup now so it overlaps
+        # with the payload fetch below; the two round trips are independent
+        table_name = os.environ.get('METADATA_TABLE_NAME')
+        table = get_table(table_name)
+        kb_items_future = _EXEC.submit(get_kb_config_items, table)
+
         # Check if processed_key is a reference to a payload in S3
         if processed_key and processed_key.startswith('payloads/'):
-            try:
-                # Retrieve the payload from S3
-                response = s3_client.get_object(Bucket=processed_bucket, Key=processed_key)
-                payload = json.loads(response['Body'].read().decode('utf-8'))
-
-                # Extract the processed_key from the payload
-                if isinstance(payload, dict) and 'metadata' in payload:
-                    processed_key = payload['metadata'].get('processed_key')
-                elif isinstance(payload, dict) and 'body' in payload:
-                    body_str = payload['body']
-                    if isinstance(body_str, str):
+            # Fast path: upstream states may inline the real key alongside the
+            # payload reference, making the S3 round trip unnecessary
+            inline_metadata = event.get('metadata')
+            if isinstance(inline_metadata, dict) and inline_metadata.get('processed_key'):
+                processed_key = inline_metadata['processed_key']
+                logger.info(f"Using processed_key inlined in the event: {processed_key}")
+            else:
+                try:
+                    # Pull only the fields we need via S3 Select instead of
+                    # downloading and parsing the whole payload object
+                    global _S3_SELECT_DISABLED
+                    payload = None
+                    if not _S3_SELECT_DISABLED:
                         try:
-                            body_json = json.loads(body_str)
-                            processed_key = body_json.get('processed_key')
-                        except:
-                            pass
+                            select_response = s3_client.select_object_content(
+                                Bucket=processed_bucket,
+                                Key=processed_key,
+                                ExpressionType='SQL',
+                                Expression="SELECT s.metadata.processed_key, s.body FROM S3Object s LIMIT 1",
+                                InputSerialization={'JSON': {'Type': 'DOCUMENT'}},
+                                OutputSerialization={'JSON': {}}
+                            )
+                            records = b''.join(
+                                stream_event['Records']['Payload']
+                                for stream_event in select_response['Payload']
+                                if 'Records' in stream_event
+                            )
+                            if records.strip():
+                                payload = json_loads(records)
+                        except Exception as select_error:
+                            _S3_SELECT_DISABLED = True
+                            logger.warning(
+                                f"S3 Select unavailable; using GetObject for payloads from now on: {str(select_error)}")
+
+                    if payload is None:
+                        # Retrieve the payload from S3
+                        response = s3_client.get_object(Bucket=processed_bucket, Key=processed_key)
+                        payload = json_loads(response['Body'].read())
+
+                    # Extract the processed_key from the payload; S3 Select flattens
+                    # the selected field to the top level of the record
+                    if isinstance(payload, dict) and payload.get('processed_key'):
+                        processed_key = payload['processed_key']
+                    elif isinstance(payload, dict) and 'metadata' in payload:
+                        processed_key = payload['metadata'].get('processed_key')
+                    elif isinstance(payload, dict) and 'body' in payload:
+                        body_str = payload['body']
+                        if isinstance(body_str, str):
+                            try:
+                                body_json = json.loads(body_str)
+                                processed_key = body_json.get('processed_key')
+                            except:
+                                pass
 
-                print(f"Retrieved processed_key from S3: {processed_key}")
-            except Exception as e:
-                print(f"Error retrieving payload from S3: {str(e)}")
-                return {
-                    'statusCode': 500,
-                    'body': json.dumps(f'Error retrieving payload from S3: {str(e)}')
-                }
+                    logger.info(f"Retrieved processed_key from S3: {processed_key}")
+                except Exception as e:
+                    logger.error(f"Error retrieving payload from S3: {str(e)}")
+                    return {
+                        'statusCode': 500,
+                        'body': json.dumps(f'Error retrieving payload from S3: {str(e)}')
+                    }
 
         if not processed_bucket or not processed_key:
             return {
@@ -383,21 +1135,13 @@ def add_document_to_knowledge_base(event):
                 'body': json.dumps('Missing processed_bucket or processed_key parameter')
             }
 
-        # Get the knowledge base configuration from DynamoDB
-        table_name = os.environ.get('METADATA_TABLE_NAME')
-        table = dynamodb.Table(table_name)
-
-        response = table.query(
-            IndexName='DocumentIdIndex',
-            KeyConditionExpression='document_id = :did',
-            ExpressionAttributeValues={
-                ':did': 'KNOWLEDGE_BASE_CONFIG'
-            }
-        )
+        # Collect the knowledge base configuration started above (cached on
+        # warm containers)
+        kb_items = kb_items_future.result()
 
         # If knowledge base configuration not found, create it
-        if not response['Items']:
-            print("Knowledge base configuration not found. Creating new knowledge base...")
+        if not kb_items:
+            logger.info("Knowledge base configuration not found. Creating new knowledge base...")
 
             # Get parameters from environment variables
             kb_name = 'DocumentProcessingKnowledgeBase'
@@ -417,7 +1161,7 @@ def add_document_to_knowledge_base(event):
                 }
 
             # Check if knowledge base already exists
-            print(f"Checking if knowledge base already exists: {kb_name}")
+            logger.info(f"Checking if knowledge base already exists: {kb_name}")
             try:
                 # Try to list existing knowledge bases
                 try:
@@ -431,7 +1175,7 @@ def add_document_to_knowledge_base(event):
                             break
                 except Exception as list_error:
                     # If we can't list knowledge bases due to permissions, try to query DynamoDB first
-                    print(f"Error listing knowledge bases: {str(list_error)}. Checking DynamoDB for existing configuration.")
+                    logger.error(f"Error listing knowledge bases: {str(list_error)}. Checking DynamoDB for existing configuration.")
                     existing_kb = None
 
                     # Try to get the knowledge base configuration from DynamoDB
@@ -440,7 +1184,8 @@ def add_document_to_knowledge_base(event):
                         KeyConditionExpression='document_id = :did',
                         ExpressionAttributeValues={
                             ':did': 'KNOWLEDGE_BASE_CONFIG'
-                        }
+                        },
+                        Limit=1
                     )
 
 
@@ -455,16 +1200,16 @@ def add_document_to_knowledge_base(event):
 
                 if existing_kb:
                     # Use the existing knowledge base
-                    print(f"Using existing knowledge base: {kb_name} with ID: {existing_kb['knowledgeBaseId']}")
+                    logger.info(f"Using existing knowledge base: {kb_name} with ID: {existing_kb['knowledgeBaseId']}")
                     kb_id = existing_kb['knowledgeBaseId']
 
                     # For Kendra knowledge bases, we don't need to create a data source
                     # Kendra has its own data source management
-                    print("This is a Kendra knowledge base, skipping data source creation")
+                    logger.info("This is a Kendra knowledge base, skipping data source creation")
                     ds_id = "KENDRA_MANAGED"  # Use a placeholder for the data source ID
                 else:
                     # Create a new knowledge base
-                    print(f"Creating new knowledge base: {kb_name}")
+                    logger.info(f"Creating new knowledge base: {kb_name}")
                     kb_response = bedrock_agent.create_knowledge_base(
                         name=kb_name,
                         description='Knowledge base for processed documents',
@@ -479,65 +1224,99 @@ def add_document_to_knowledge_base(event):
 
                     # Get the knowledge base ID from the response
                     kb_id = kb_response['knowledgeBase']['knowledgeBaseId']
-                    print(f"Knowledge base created with ID: {kb_id}")
+                    logger.info(f"Knowledge base created with ID: {kb_id}")
 
                     # For Kendra knowledge bases, we don't need to create a data source
                     # Kendra has its own data source management
-                    print("This is a Kendra knowledge base, skipping data source creation")
+                    logger.info("This is a Kendra knowledge base, skipping data source creation")
                     ds_id = "KENDRA_MANAGED"  # Use a placeholder for the data source ID
 
 
 
             except Exception as kb_error:
-                print(f"Error creating knowledge base: {str(kb_error)}")
+                logger.error(f"Error creating knowledge base: {str(kb_error)}")
                 return {
                     'statusCode': 500,
                     'body': json.dumps(f'Error creating knowledge base: {str(kb_error)}')
                 }
 
-            # Generate a unique ID for the config
-            import uuid
-            kb_config_id = str(uuid.uuid4())
-
-            # Store the knowledge base configuration in DynamoDB
-            print(f"Storing knowledge base configuration in DynamoDB")
-            from datetime import datetime
-            table.put_item(Item={
-                'id': kb_config_id,
+            # Store the knowledge base configuration in DynamoDB under a fixed
+            # key so two concurrent invocations cannot write duplicate rows:
+            # the conditional put lets exactly one writer win
+            logger.info(f"Storing knowledge base configuration in DynamoDB")
+            now_iso = datetime.now(timezone.utc).isoformat()
+            kb_config_item = {
+                'id': 'KNOWLEDGE_BASE_CONFIG',
                 'document_id': 'KNOWLEDGE_BASE_CONFIG',
                 'knowledge_base_id': kb_id,
                 'data_source_id': ds_id,
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat(),
+                'created_at': now_iso,
+                'updated_at': now_iso,
                 'status': 'CREATED'
-            })
-
-            # Query again to get the newly created configuration
-            response = table.query(
-                IndexName='DocumentIdIndex',
-                KeyConditionExpression='document_id = :did',
-                ExpressionAttributeValues={
-                    ':did': 'KNOWLEDGE_BASE_CONFIG'
-                }
-            )
-
-            if not response['Items']:
-                return {
-                    'statusCode': 500,
-                    'body': json.dumps('Failed to create knowledge base configuration')
-                }
+            }
+            try:
+                table.put_item(
+                    Item=kb_config_item,
+                    ConditionExpression='attribute_not_exists(#i)',
+                    ExpressionAttributeNames={'#i': 'id'}
+                )
+                # Use the item just written instead of re-querying the GSI,
+                # which costs a round trip and can miss under eventual
+                # consistency
+                kb_items = [kb_config_item]
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                # A concurrent invocation wrote the config first; reuse it
+                logger.info("KB configuration already written concurrently; re-reading it")
+                _KB_CONFIG_CACHE['items'] = None
+                kb_items = get_kb_config_items(table)
+                if not kb_items:
+                    return {
+                        'statusCode': 500,
+                        'body': json.dumps('Failed to create knowledge base configuration')
+                    }
+            _KB_CONFIG_CACHE['items'] = kb_items
+            _KB_CONFIG_CACHE['ts'] = time.time()
 
-            print("Successfully created and stored knowledge base configuration")
+            logger.info("Successfully created and stored knowledge base configuration")
 
         # Now we should have a valid knowledge base configuration
-        kb_config = response['Items'][0]
+        kb_config = kb_items[0]
         kb_id = kb_config['knowledge_base_id']
         ds_id = kb_config['data_source_id']
 
+        # One timestamp for the whole ingestion pass: it feeds both the unique
+        # Kendra document ID and the metadata row's updated_at below.
+        ingest_started_at = datetime.now(timezone.utc)
+
+        # Resolve the metadata row's primary key concurrently with the
+        # ingestion work below; it is only consumed by the final status
+        # update, and the mapping is container-cached for repeat ingests
+        document_id = event.get('document_id', os.path.splitext(os.path.basename(processed_key))[0])
+
+        def _resolve_doc_pk(doc_id):
+            item_id = _DOC_ID_PK_CACHE.get(doc_id)
+            if item_id is None:
+                pk_response = table.query(
+                    IndexName='DocumentIdIndex',
+                    KeyConditionExpression='document_id = :did',
+                    ExpressionAttributeValues={
+                        ':did': doc_id
+                    },
+                    ProjectionExpression='#i',
+                    ExpressionAttributeNames={'#i': 'id'},
+                    Limit=1
+                )
+                if pk_response['Items']:
+                    item_id = pk_response['Items'][0]['id']
+                    _DOC_ID_PK_CACHE[doc_id] = item_id
+            return item_id
+
+        doc_pk_future = _EXEC.submit(_resolve_doc_pk, document_id)
+
         # For Kendra knowledge bases, we need to use a different approach to add documents
         try:
             if ds_id == "KENDRA_MANAGED":
-                print(f"This is a Kendra knowledge base. Using Kendra's document ingestion methods.")
+                logger.info(f"This is a Kendra knowledge base. Using Kendra's document ingestion methods.")
 
                 # Extract the Kendra index ID from the knowledge base ARN
                 # The ARN format is: arn:aws:kendra:region:account-id:index/index-id
@@ -545,24 +1324,30 @@ def add_document_to_knowledge_base(event):
 
                 # Get the document ID from the event or from the processed key
                 document_id = event.get('document_id', os.path.splitext(os.path.basename(processed_key))[0])
-                print(f"Using document ID: {document_id}")
+                logger.info(f"Using document ID: {document_id}")
+
+                # Reuse the module-level Kendra client
+                kendra_client = get_kendra_client()
 
-                # Create a Kendra client
-                kendra_client = boto3.client('kendra')
+                # Fetch the document content in the background while the
+                # Kendra data-source probe below runs; the calls are independent
+                document_future = _EXEC.submit(
+                    s3_client.get_object, Bucket=processed_bucket, Key=processed_key
+                )
 
                 # First, check if the Kendra index has any S3 data sources
                 try:
-                    print(f"Checking for S3 data sources in Kendra index: {kendra_index_id}")
+                    logger.info(f"Checking for S3 data sources in Kendra index: {kendra_index_id}")
                     data_sources_response = kendra_client.list_data_sources(
                         IndexId=kendra_index_id
                     )
 
                     s3_data_source = None
                     for ds in data_sources_response.get('SummaryItems', []):
-                        print(f"Found data source: {ds.get('Name')} (Type: {ds.get('Type')})")
+                        logger.info(f"Found data source: {ds.get('Name')} (Type: {ds.get('Type')})")
                         if ds.get('Type') == 'S3':
                             s3_data_source = ds
-                            print(f"Found S3 data source: {ds.get('Name')} (ID: {ds.get('Id')})")
+                            logger.info(f"Found S3 data source: {ds.get('Name')} (ID: {ds.get('Id')})")
                             break
 
                     if s3_data_source:
@@ -582,140 +1367,32 @@ def add_document_to_knowledge_base(event):
                         if not s3_bucket:
                             # Use the S3 bucket from environment variable
                             s3_bucket = os.environ.get('KENDRA_S3_BUCKET', 'aseekbot-poc-kb')
-                            print(f"Using Kendra S3 data source bucket from environment: {s3_bucket}")
+                            logger.info(f"Using Kendra S3 data source bucket from environment: {s3_bucket}")
 
-                        print(f"Found Kendra S3 data source bucket: {s3_bucket}, prefix: {s3_prefix}")
+                        logger.info(f"Found Kendra S3 data source bucket: {s3_bucket}, prefix: {s3_prefix}")
                         use_s3_data_source = True
                     else:
-                        print("No S3 data source found. Falling back to BatchPutDocument.")
+                        logger.info("No S3 data source found. Falling back to BatchPutDocument.")
                         use_s3_data_source = False
 
                 except Exception as ds_error:
-                    print(f"Error checking data sources: {str(ds_error)}. Falling back to BatchPutDocument.")
+                    logger.error(f"Error checking data sources: {str(ds_error)}. Falling back to BatchPutDocument.")
                     use_s3_data_source = False
 
                 # Skip checking existing documents as list_documents is not available in this version of the SDK
-                print(f"Skipping document listing as it's not supported in this SDK version")
+                logger.info(f"Skipping document listing as it's not supported in this SDK version")
 
                 # Get the document content from S3
                 try:
-                    s3_response = s3_client.get_object(Bucket=processed_bucket, Key=processed_key)
-                    document_content = s3_response['Body'].read().decode('utf-8')
-                    document_json = json.loads(document_content)
-
-                    # Extract text content from the processed document
-                    text_content = ""
-
-                    # Print the document JSON structure to help debug
-                    if isinstance(document_json, dict):
-                        print(f"Document JSON keys: {list(document_json.keys())}")
-                    elif isinstance(document_json, list):
-                        print(f"Document JSON is a list with {len(document_json)} items")
-                        if document_json and isinstance(document_json[0], dict):
-                            print(f"First item keys: {list(document_json[0].keys())}")
-                    else:
-                        print(f"Document JSON is of type: {type(document_json)}")
-
-                    # Handle different document_json structures
-                    if isinstance(document_json, dict):
-                        # Check for document_content field which is likely to contain the full text
-                        if 'document_content' in document_json:
-                            if isinstance(document_json['document_content'], dict) and 'text_content' in document_json['document_content']:
-                                text_content = document_json['document_content']['text_content']
-                                print(f"Found document_content.text_content field with length: {len(text_content)}")
-                            elif isinstance(document_json['document_content'], str):
-                                text_content = document_json['document_content']
-                                print(f"Found document_content field with length: {len(text_content)}")
-                        elif 'text_content' in document_json:
-                            text_content = document_json['text_content']
-                            print(f"Found text_content field with length: {len(text_content)}")
-                        elif 'content' in document_json:
-                            text_content = document_json['content']
-                            print(f"Found content field with length: {len(text_content)}")
-                        elif 'body' in document_json:
-                            text_content = document_json['body']
-                            print(f"Found body field with length: {len(text_content)}")
-                        elif 'text' in document_json:
-                            text_content = document_json['text']
-                            print(f"Found text field with length: {len(text_content)}")
-                    elif isinstance(document_json, list):
-                        # If it's a list, try to extract text from each item
-                        print("Document JSON is a list, extracting text from items")
-                        combined_text = []
-
-                        for idx, item in enumerate(document_json):
-                            if isinstance(item, dict):
-                                # Try to extract text from common fields
-                                item_text = ""
-                                if 'text_content' in item:
-                                    item_text = item['text_content']
-                                elif 'ai_generated_description' in item:
-                                    item_text = item['ai_generated_description']
-                                elif 'description' in item:
-                                    item_text = item['description']
-                                elif 'text' in item:
-                                    item_text = item['text']
-
-                                if item_text:
-                                    combined_text.append(f"Item {idx+1}: {item_text}")
-                                    print(f"Extracted text from item {idx+1} with length: {len(item_text)}")
-                            elif isinstance(item, str):
-                                combined_text.append(item)
-                                print(f"Added string item {idx+1} with length: {len(item)}")
-
-                        if combined_text:
-                            text_content = "\n\n".join(combined_text)
-                            print(f"Combined text from {len(combined_text)} items, total length: {len(text_content)}")
-                        else:
-                            # If we couldn't extract text from items, use the JSON representation
-                            text_content = json.dumps(document_json, indent=2)
-                            print(f"No text extracted from list items, using JSON representation with length: {len(text_content)}")
-
-                    # If we still don't have content, try to extract it from nested structures
-                    if not text_content and isinstance(document_json, dict):
-                        # Try to find any field that might contain the text content
-                        for key, value in document_json.items():
-                            if isinstance(value, str) and len(value) > 100:  # Assume large string fields are content
-                                text_content = value
-                                print(f"Found potential content in field '{key}' with length: {len(text_content)}")
-                                break
-                            elif isinstance(value, dict):
-                                # Check nested dictionary
-                                for nested_key, nested_value in value.items():
-                                    if isinstance(nested_value, str) and len(nested_value) > 100:
-                                        text_content = nested_value
-                                        print(f"Found potential content in nested field '{key}.{nested_key}' with length: {len(text_content)}")
-                                        break
+                    text_content, metadata, text_is_verbatim = fetch_and_extract_text(
+                        processed_bucket, processed_key,
+                        s3_response=document_future.result()
+                    )
 
-                    # If we still don't have content, dump the entire JSON as text
-                    if not text_content:
-                        print("No content field found. Using the entire JSON as content.")
-                        text_content = json.dumps(document_json, indent=2)
-                        print(f"Generated content from full JSON with length: {len(text_content)}")
-
-                    # Extract any metadata from the document
-                    metadata = {}
-                    if isinstance(document_json, dict):
-                        # Extract metadata fields if they exist
-                        if 'metadata' in document_json and isinstance(document_json['metadata'], dict):
-                            metadata = document_json['metadata']
-                        elif 'document_metadata' in document_json and isinstance(document_json['document_metadata'], dict):
-                            metadata = document_json['document_metadata']
-                    elif isinstance(document_json, list) and document_json:
-                        # If it's a list, try to extract metadata from the first item
-                        first_item = document_json[0]
-                        if isinstance(first_item, dict):
-                            if 'metadata' in first_item and isinstance(first_item['metadata'], dict):
-                                metadata = first_item['metadata']
-                            elif 'document_metadata' in first_item and isinstance(first_item['document_metadata'], dict):
-                                metadata = first_item['document_metadata']
-
-                        # Add some metadata about the list itself
-                        metadata['item_count'] = str(len(document_json))
-                        metadata['document_type'] = 'image_descriptions'
-
-                    # Create attributes for Kendra
+                    # Create attributes for Kendra and the sidecar metadata
+                    # lines in one pass over the dict instead of two
                     attributes = []
+                    metadata_lines = []
                     for key, value in metadata.items():
                         if isinstance(value, str):
                             attributes.append({
@@ -724,11 +1401,9 @@ def add_document_to_knowledge_base(event):
                                     'StringValue': value
                                 }
                             })
+                            metadata_lines.append(f"{key}={value}")
 
                     # Create a unique document ID for Kendra
-                    import re
-                    import uuid
-                    from datetime import datetime
 
                     # Start with the original document ID
                     base_doc_id = document_id
@@ -738,76 +1413,93 @@ def add_document_to_knowledge_base(event):
                         base_doc_id = base_doc_id.rsplit('.', 1)[0]
 
                     # Replace spaces and special characters with underscores
-                    base_doc_id = re.sub(r'[^a-zA-Z0-9]', '_', base_doc_id)
+                    base_doc_id = sanitize_doc_id(base_doc_id)
 
                     # Add a timestamp and UUID to make it unique
-                    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                    unique_id = str(uuid.uuid4())[:8]  # Use first 8 chars of UUID
+                    timestamp = ingest_started_at.strftime('%Y%m%d%H%M%S')
+                    unique_id = uuid.uuid4().hex[:8]  # Use first 8 chars of UUID
 
                     # Combine to create a unique document ID
                     clean_doc_id = f"{base_doc_id}_{timestamp}_{unique_id}"
 
-                    print(f"Original document ID: {document_id}")
-                    print(f"Unique document ID for Kendra: {clean_doc_id}")
+                    logger.info(f"Original document ID: {document_id}")
+                    logger.info(f"Unique document ID for Kendra: {clean_doc_id}")
 
                     # Check if we should use S3 data source or BatchPutDocument
                     if 'use_s3_data_source' in locals() and use_s3_data_source and 's3_bucket' in locals() and s3_bucket:
                         # Create a unique filename for the document
                         unique_filename = f"{clean_doc_id}.txt"
 
-                        # Construct the full S3 key with the prefix
-                        s3_key = f"{s3_prefix}/{unique_filename}" if s3_prefix else unique_filename
-                        s3_key = s3_key.replace('//', '/')  # Avoid double slashes
-
-                        print(f"Uploading to Kendra S3 data source as: {s3_key}")
-
-                        # Create a metadata file if we have metadata
-                        if metadata:
-                            # Format metadata according to Kendra's requirements
-                            # See: https://docs.aws.amazon.com/kendra/latest/dg/s3-metadata.html
-                            metadata_lines = []
-                            for key, value in metadata.items():
-                                if isinstance(value, str):
-                                    metadata_lines.append(f"{key}={value}")
-
-                            if metadata_lines:
-                                metadata_content = "\n".join(metadata_lines)
-                                metadata_filename = f"{unique_filename}.metadata.txt"
-                                metadata_key = f"{s3_prefix}/{metadata_filename}" if s3_prefix else metadata_filename
-                                metadata_key = metadata_key.replace('//', '/')  # Avoid double slashes
-
-                                print(f"Uploading metadata file to: {metadata_key}")
-                                s3_client.put_object(
-                                    Bucket=s3_bucket,
-                                    Key=metadata_key,
-                                    Body=metadata_content,
-                                    ContentType='text/plain'
-                                )
+                        # Construct the full S3 key with the prefix, stripping
+                        # stray slashes so the join never doubles them
+                        s3_key = '/'.join(p.strip('/') for p in (s3_prefix, unique_filename) if p)
+
+                        logger.info(f"Uploading to Kendra S3 data source as: {s3_key}")
+
+                        # Collect the document upload and, if present, its
+                        # metadata file so the independent PutObject calls can
+                        # run in parallel. A verbatim plain-text source is
+                        # copied server-side instead of re-uploaded.
+                        if text_is_verbatim:
+                            logger.info(f"Copying source object to Kendra S3 data source bucket: {s3_bucket}/{s3_key}")
+                            s3_client.copy_object(
+                                Bucket=s3_bucket,
+                                Key=s3_key,
+                                CopySource={'Bucket': processed_bucket, 'Key': processed_key},
+                                MetadataDirective='REPLACE',
+                                ContentType='text/plain'
+                            )
+                            uploads = []
+                        else:
+                            uploads = [{
+                                'Bucket': s3_bucket,
+                                'Key': s3_key,
+                                'Body': text_content,
+                                'ContentType': 'text/plain'
+                            }]
+
+                        # Create a metadata file if we have metadata, reusing the
+                        # lines collected while building the Kendra attributes
+                        # See: https://docs.aws.amazon.com/kendra/latest/dg/s3-metadata.html
+                        if metadata_lines:
+                            metadata_content = "\n".join(metadata_lines)
+                            metadata_filename = f"{unique_filename}.metadata.txt"
+                            metadata_key = '/'.join(p.strip('/') for p in (s3_prefix, metadata_filename) if p)
+
+                            logger.info(f"Uploading metadata file to: {metadata_key}")
+                            uploads.append({
+                                'Bucket': s3_bucket,
+                                'Key': metadata_key,
+                                'Body': metadata_content,
+                                'ContentType': 'text/plain'
+                            })
 
-                        # Upload the document to the Kendra S3 data source bucket
-                        print(f"Uploading document to Kendra S3 data source bucket: {s3_bucket}/{s3_key}")
-                        print(f"Document content length: {len(text_content)} characters")
+                        # Upload to the Kendra S3 data source bucket
+                        logger.info(f"Uploading document to Kendra S3 data source bucket: {s3_bucket}/{s3_key}")
+                        logger.info(f"Document content length: {len(text_content)} characters")
 
-                        s3_client.put_object(
-                            Bucket=s3_bucket,
-                            Key=s3_key,
-                            Body=text_content,
-                            ContentType='text/plain'
-                        )
+                        if not uploads:
+                            pass  # Verbatim copy with no metadata file
+                        elif len(uploads) == 1:
+                            put_object_bytes(uploads[0])
+                        else:
+                            # list() propagates the first exception, matching
+                            # the sequential behaviour
+                            list(_EXEC.map(put_object_bytes, uploads))
 
                         # Start a sync job to make the document available immediately
-                        print(f"Starting sync job for data source: {ds_id}")
+                        logger.info(f"Starting sync job for data source: {ds_id}")
                         sync_response = kendra_client.start_data_source_sync_job(
                             IndexId=kendra_index_id,
                             Id=ds_id
                         )
 
                         job_id = sync_response['ExecutionId']
-                        print(f"Started sync job with ID: {job_id}")
+                        logger.info(f"Started sync job with ID: {job_id}")
                     else:
                         # Use BatchPutDocument to add the document to Kendra
-                        print(f"Adding document to Kendra index: {kendra_index_id}")
-                        print(f"Document content length: {len(text_content)} characters")
+                        logger.info(f"Adding document to Kendra index: {kendra_index_id}")
+                        logger.info(f"Document content length: {len(text_content)} characters")
 
                         # Prepare the document with attributes
                         document = {
@@ -820,7 +1512,7 @@ def add_document_to_knowledge_base(event):
                         # Add attributes if we have any
                         if attributes:
                             document['Attributes'] = attributes
-                            print(f"Adding document with {len(attributes)} metadata attributes")
+                            logger.info(f"Adding document with {len(attributes)} metadata attributes")
 
                         kendra_response = kendra_client.batch_put_document(
                             IndexId=kendra_index_id,
@@ -828,257 +1520,194 @@ def add_document_to_knowledge_base(event):
                         )
 
                         job_id = f"KENDRA-{kendra_response['ResponseMetadata']['RequestId']}"
-                        print(f"Document added to Kendra index with job ID: {job_id}")
+                        logger.info(f"Document added to Kendra index with job ID: {job_id}")
 
 
 
-                    # Wait for document ingestion to complete
-                    try:
-                        import time
-                        max_wait_time = 300  # Maximum wait time in seconds (5 minutes)
-                        wait_interval = 10   # Check every 10 seconds
-                        start_time = time.time()
-                        ingestion_complete = False
-
-                        print(f"Waiting for document ingestion to complete (timeout: {max_wait_time} seconds)...")
+                    # Polling Kendra for INDEXED is observability only; skip it unless
+                    # a synchronous caller explicitly asks to wait
+                    ingestion_complete = False
+                    if not WAIT_FOR_INGESTION:
+                        logger.info("WAIT_FOR_INGESTION disabled; returning without polling Kendra document status")
+                    else:
+                        try:
+                            max_wait_time = 300  # Maximum wait time in seconds (5 minutes)
+                            start_time = time.time()
+                            ingestion_complete = False
+                            attempt = 0
 
-                        while (time.time() - start_time) < max_wait_time:
-                            # Check the status of the document
-                            doc_status_response = kendra_client.batch_get_document_status(
-                                IndexId=kendra_index_id,
-                                DocumentInfoList=[
-                                    {
-                                        'DocumentId': clean_doc_id
-                                    }
-                                ]
-                            )
+                            logger.info(f"Waiting for document ingestion to complete (timeout: {max_wait_time} seconds)...")
 
-                            # Log the document status
-                            if 'DocumentStatusList' in doc_status_response and doc_status_response['DocumentStatusList']:
-                                doc_status = doc_status_response['DocumentStatusList'][0]
-                                status = doc_status.get('Status', 'Unknown')
-                                print(f"Document status in Kendra: {status}")
-                                print(f"Full document status: {json.dumps(doc_status)}")
+                            while (time.time() - start_time) < max_wait_time:
+                                # Check the status of the document
+                                doc_status_response = kendra_client.batch_get_document_status(
+                                    IndexId=kendra_index_id,
+                                    DocumentInfoList=[
+                                        {
+                                            'DocumentId': clean_doc_id
+                                        }
+                                    ]
+                                )
 
-                                if status == 'INDEXED':
-                                    print(f"Document successfully indexed in Kendra")
-                                    ingestion_complete = True
-                                    break
-                                elif status in ['FAILED', 'ERROR']:
-                                    print(f"Document indexing failed: {doc_status.get('FailureReason', 'Unknown reason')}")
-                                    break
-                                elif status == 'Unknown' and (time.time() - start_time) > 60:
-                                    # After 60 seconds of Unknown status, try to verify with a query
-                                    try:
-                                        print("Attempting to verify document availability with a query...")
-                                        # Extract some content from the document to use as a query
-                                        query_text = ""
-                                        if len(text_content) > 20:
-                                            # Use the first 100 characters as a query
-                                            query_text = text_content[:100].strip()
-                                        else:
-                                            # Fall back to document ID
-                                            query_text = document_id
-
-                                        print(f"Querying with text: '{query_text[:50]}...'")
-
-                                        # Try to query for the document to see if it's available
-                                        query_response = kendra_client.query(
-                                            IndexId=kendra_index_id,
-                                            QueryText=query_text
-                                        )
-
-                                        # Check if we got any results
-                                        if 'ResultItems' in query_response and query_response['ResultItems']:
-                                            print(f"Document found in query results! Document appears to be available.")
-                                            print(f"Query returned {len(query_response['ResultItems'])} results")
-                                            ingestion_complete = True
-                                            break
-                                        else:
-                                            print("Document not found in query results yet")
-                                    except Exception as query_error:
-                                        print(f"Error querying for document: {str(query_error)}")
-                            else:
-                                print("No document status information available yet")
-
-                                # After 60 seconds with no status, try listing all documents
-                                if (time.time() - start_time) > 60 and (time.time() - start_time) < 70:
-                                    try:
-                                        print("Attempting to list documents in Kendra index...")
-                                        # Try to list documents to see if our document is there
-                                        list_response = kendra_client.list_documents(
-                                            IndexId=kendra_index_id
-                                        )
-
-                                        print(f"Found {len(list_response.get('DocumentInfoList', []))} documents in index")
-                                        # Check if our document is in the list
-                                        for doc_info in list_response.get('DocumentInfoList', []):
-                                            print(f"Document in index: {doc_info.get('DocumentId')}")
-                                            if doc_info.get('DocumentId') == clean_doc_id:
-                                                print(f"Our document found in index list!")
-                                                break
-                                    except Exception as list_error:
-                                        print(f"Error listing documents: {str(list_error)}")
+                                # Log the document status
+                                if 'DocumentStatusList' in doc_status_response and doc_status_response['DocumentStatusList']:
+                                    doc_status = doc_status_response['DocumentStatusList'][0]
+                                    status = doc_status.get('Status', 'Unknown')
+                                    logger.info(f"Document status in Kendra: {status}")
 
-                            # Wait before checking again
-                            time.sleep(wait_interval)
+                                    if status == 'INDEXED':
+                                        logger.info(f"Document successfully indexed in Kendra")
+                                        ingestion_complete = True
+                                        break
+                                    elif status in ['FAILED', 'ERROR']:
+                                        logger.error(f"Document indexing failed: {doc_status.get('FailureReason', 'Unknown reason')}")
+                                        break
+                                else:
+                                    logger.info("No document status information available yet")
 
-                        if not ingestion_complete:
-                            print(f"Warning: Document ingestion did not complete within {max_wait_time} seconds")
-                            print(f"The Step Function will continue, but the document may not be immediately available for querying")
+                                # Exponential backoff with jitter: fast indexing is
+                                # caught within seconds, while long waits back off to
+                                # spare the low-TPS Kendra status API
+                                attempt += 1
+                                wait_interval = min(30, 2 ** attempt + random.uniform(0, 1))
+                                time.sleep(wait_interval)
 
-                            # Try one final query to see if the document is available
-                            try:
-                                print("Performing final verification query...")
-                                # Extract some content from the document to use as a query
-                                query_text = ""
-                                if len(text_content) > 20:
-                                    # Use the first 100 characters as a query
-                                    query_text = text_content[:100].strip()
-                                else:
-                                    # Fall back to document ID
-                                    query_text = document_id
+                            if not ingestion_complete:
+                                logger.warning(f"Warning: Document ingestion did not complete within {max_wait_time} seconds")
+                                logger.info(f"The Step Function will continue, but the document may not be immediately available for querying")
 
-                                print(f"Final verification query with text: '{query_text[:50]}...'")
 
-                                query_response = kendra_client.query(
+                            # Get final document status for logging; when the wait
+                            # loop already saw INDEXED the last observed status is
+                            # current, so the extra Kendra call is skipped
+                            if not ingestion_complete:
+                                doc_status_response = kendra_client.batch_get_document_status(
                                     IndexId=kendra_index_id,
-                                    QueryText=query_text
+                                    DocumentInfoList=[
+                                        {
+                                            'DocumentId': clean_doc_id
+                                        }
+                                    ]
                                 )
 
-                                if 'ResultItems' in query_response and query_response['ResultItems']:
-                                    print(f"Good news! Document found in final query results. Document appears to be available.")
-                                    print(f"Query returned {len(query_response['ResultItems'])} results")
-                                    ingestion_complete = True
-                                else:
-                                    print("Document not found in final query results")
-
-                                    # Try listing all documents one last time
-                                    try:
-                                        print("Final attempt to list documents in Kendra index...")
-                                        list_response = kendra_client.list_documents(
-                                            IndexId=kendra_index_id
-                                        )
-
-                                        print(f"Found {len(list_response.get('DocumentInfoList', []))} documents in index")
-                                        document_found = False
-                                        for doc_info in list_response.get('DocumentInfoList', []):
-                                            if doc_info.get('DocumentId') == clean_doc_id:
-                                                print(f"Our document found in index list! Status: {doc_info.get('Status')}")
-                                                document_found = True
-                                                break
-
-                                        if not document_found:
-                                            print(f"Document {clean_doc_id} not found in index document list")
-                                    except Exception as list_error:
-                                        print(f"Error listing documents: {str(list_error)}")
-                            except Exception as final_query_error:
-                                print(f"Error in final verification query: {str(final_query_error)}")
-
-                        # Get final document status for logging
-                        doc_status_response = kendra_client.batch_get_document_status(
-                            IndexId=kendra_index_id,
-                            DocumentInfoList=[
-                                {
-                                    'DocumentId': clean_doc_id
-                                }
-                            ]
-                        )
-
-                        if 'DocumentStatusList' in doc_status_response and doc_status_response['DocumentStatusList']:
-                            doc_status = doc_status_response['DocumentStatusList'][0]
-                            print(f"Final document status: {json.dumps(doc_status)}")
+                                if 'DocumentStatusList' in doc_status_response and doc_status_response['DocumentStatusList']:
+                                    doc_status = doc_status_response['DocumentStatusList'][0]
+                                    logger.info(f"Final document status: {json.dumps(doc_status)}")
 
-                        print(f"Document ingestion process completed. Ingestion success: {ingestion_complete}")
-                    except Exception as status_error:
-                        print(f"Error checking document status: {str(status_error)}")
+                            logger.info(f"Document ingestion process completed. Ingestion success: {ingestion_complete}")
+                        except Exception as status_error:
+                            logger.error(f"Error checking document status: {str(status_error)}")
 
                 except Exception as s3_error:
-                    print(f"Error getting document from S3: {str(s3_error)}")
+                    logger.error(f"Error getting document from S3: {str(s3_error)}")
                     raise s3_error
             else:
-                # For vector knowledge bases, use the standard ingestion job
-                print(f"Starting ingestion job for knowledge base: {kb_id}, data source: {ds_id}")
-                ingestion_response = bedrock_agent.start_ingestion_job(
-                    knowledgeBaseId=kb_id,
-                    dataSourceId=ds_id,
-                    description=f'Ingestion job for {processed_key}'
-                )
+                # For vector knowledge bases, use the standard ingestion job.
+                # An ingestion job re-scans the entire inclusion prefix, so a
+                # job that is already running will pick up this document too —
+                # reuse it instead of starting a duplicate job per document.
+                job_id = None
+                try:
+                    jobs_response = bedrock_agent.list_ingestion_jobs(
+                        knowledgeBaseId=kb_id,
+                        dataSourceId=ds_id,
+                        filters=[{
+                            'attribute': 'STATUS',
+                            'operator': 'EQ',
+                            'values': ['STARTING', 'IN_PROGRESS']
+                        }],
+                        maxResults=1
+                    )
+                    job_summaries = jobs_response.get('ingestionJobSummaries', [])
+                    if job_summaries:
+                        job_id = job_summaries[0]['ingestionJobId']
+                        logger.info(f"Reusing in-progress ingestion job with ID: {job_id}")
+                except Exception as list_jobs_error:
+                    logger.error(f"Error listing ingestion jobs: {str(list_jobs_error)}")
+
+                if job_id is None:
+                    logger.info(f"Starting ingestion job for knowledge base: {kb_id}, data source: {ds_id}")
+                    ingestion_response = bedrock_agent.start_ingestion_job(
+                        knowledgeBaseId=kb_id,
+                        dataSourceId=ds_id,
+                        description=f'Ingestion job for {processed_key}'
+                    )
 
-                job_id = ingestion_response['ingestionJob']['ingestionJobId']
-                print(f"Started ingestion job with ID: {job_id}")
+                    job_id = ingestion_response['ingestionJob']['ingestionJobId']
+                    logger.info(f"Started ingestion job with ID: {job_id}")
 
-                # Wait for the ingestion job to complete
-                try:
-                    import time
-                    max_wait_time = 300  # Maximum wait time in seconds (5 minutes)
-                    wait_interval = 10   # Check every 10 seconds
-                    start_time = time.time()
-                    ingestion_complete = False
+                # Same best-effort contract as the Kendra path: only poll the
+                # ingestion job when a synchronous caller asks for it
+                ingestion_complete = False
+                if not WAIT_FOR_INGESTION:
+                    logger.info("WAIT_FOR_INGESTION disabled; returning without polling the ingestion job")
+                else:
+                    try:
+                        max_wait_time = 300  # Maximum wait time in seconds (5 minutes)
+                        wait_interval = 10   # Check every 10 seconds
+                        start_time = time.time()
+                        ingestion_complete = False
 
-                    print(f"Waiting for ingestion job to complete (timeout: {max_wait_time} seconds)...")
+                        logger.info(f"Waiting for ingestion job to complete (timeout: {max_wait_time} seconds)...")
 
-                    while (time.time() - start_time) < max_wait_time:
-                        # Check the status of the ingestion job
-                        job_response = bedrock_agent.get_ingestion_job(
-                            knowledgeBaseId=kb_id,
-                            ingestionJobId=job_id
-                        )
+                        while (time.time() - start_time) < max_wait_time:
+                            # Check the status of the ingestion job
+                            job_response = bedrock_agent.get_ingestion_job(
+                                knowledgeBaseId=kb_id,
+                                ingestionJobId=job_id
+                            )
 
-                        status = job_response['ingestionJob']['status']
-                        print(f"Ingestion job status: {status}")
+                            status = job_response['ingestionJob']['status']
+                            logger.info(f"Ingestion job status: {status}")
 
-                        if status == 'COMPLETE':
-                            print(f"Ingestion job completed successfully")
-                            ingestion_complete = True
-                            break
-                        elif status in ['FAILED', 'STOPPED']:
-                            print(f"Ingestion job failed: {job_response['ingestionJob'].get('failureReason', 'Unknown reason')}")
-                            break
+                            if status == 'COMPLETE':
+                                logger.info(f"Ingestion job completed successfully")
+                                ingestion_complete = True
+                                break
+                            elif status in ['FAILED', 'STOPPED']:
+                                logger.error(f"Ingestion job failed: {job_response['ingestionJob'].get('failureReason', 'Unknown reason')}")
+                                break
 
-                        # Wait before checking again
-                        time.sleep(wait_interval)
+                            # Wait before checking again
+                            time.sleep(wait_interval)
 
-                    if not ingestion_complete:
-                        print(f"Warning: Ingestion job did not complete within {max_wait_time} seconds")
-                        print(f"The Step Function will continue, but the document may not be immediately available for querying")
-                except Exception as job_status_error:
-                    print(f"Error checking ingestion job status: {str(job_status_error)}")
+                        if not ingestion_complete:
+                            logger.warning(f"Warning: Ingestion job did not complete within {max_wait_time} seconds")
+                            logger.info(f"The Step Function will continue, but the document may not be immediately available for querying")
+                    except Exception as job_status_error:
+                        logger.error(f"Error checking ingestion job status: {str(job_status_error)}")
         except Exception as ingest_error:
-            print(f"Error in document ingestion: {str(ingest_error)}")
+            logger.error(f"Error in document ingestion: {str(ingest_error)}")
             raise ingest_error
 
-        # Update the document metadata with the ingestion job ID
-        # Use the document_id from the event if available, otherwise extract from the processed key
-        if 'document_id' not in locals() or not document_id:
-            document_id = event.get('document_id', os.path.splitext(os.path.basename(processed_key))[0])
-
-        response = table.query(
-            IndexName='DocumentIdIndex',
-            KeyConditionExpression='document_id = :did',
-            ExpressionAttributeValues={
-                ':did': document_id
-            }
-        )
-
-        if response['Items']:
-            metadata_item = response['Items'][0]
-
-            # Import datetime for timestamp
-            from datetime import datetime
+        # Update the document metadata with the ingestion job ID; the primary
+        # key lookup was started before ingestion, so collect its result here
+        try:
+            item_id = doc_pk_future.result()
+        except Exception as pk_error:
+            logger.error(f"Error resolving metadata key for {document_id}: {str(pk_error)}")
+            item_id = None
 
-            table.update_item(
-                Key={
-                    'id': metadata_item['id'],
-                    'document_id': metadata_item['document_id']
-                },
-                UpdateExpression='SET ingestion_job_id = :jid, updated_at = :ua, kb_status = :st',
-                ExpressionAttributeValues={
-                    ':jid': job_id,
-                    ':ua': datetime.now().isoformat(),
-                    ':st': 'INGESTING'
-                }
-            )
+        if item_id:
+            try:
+                table.update_item(
+                    Key={
+                        'id': item_id,
+                        'document_id': document_id
+                    },
+                    UpdateExpression='SET ingestion_job_id = :jid, updated_at = :ua, kb_status = :st',
+                    ConditionExpression='attribute_exists(#i)',
+                    ExpressionAttributeNames={'#i': 'id'},
+                    ExpressionAttributeValues={
+                        ':jid': job_id,
+                        ':ua': ingest_started_at.isoformat(),
+                        ':st': 'INGESTING'
+                    }
+                )
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                # Cached primary key went stale (item deleted/rewritten); drop it
+                logger.info(f"Cached metadata key for {document_id} was stale, skipping status update")
+                _DOC_ID_PK_CACHE.pop(document_id, None)
 
         # Prepare success response
         response_data = {
@@ -1091,9 +1720,11 @@ def add_document_to_knowledge_base(event):
             })
         }
 
-        # Estimate the size of the response
-        response_size = len(json.dumps(response_data))
-        print(f"Estimated response size: {response_size} bytes")
+        # Serialize once: the same string is measured for the size check and,
+        # when oversized, uploaded as the S3 body
+        serialized_response = json_dumps(response_data)
+        response_size = len(serialized_response)
+        logger.info(f"Estimated response size: {response_size} bytes")
 
         # If the response is too large (over 200KB), store it in S3
         if response_size > 200000:
@@ -1101,23 +1732,16 @@ def add_document_to_knowledge_base(event):
                 # Get the payload bucket name
                 payload_bucket = os.environ.get('PAYLOAD_BUCKET_NAME')
                 if not payload_bucket:
-                    print("PAYLOAD_BUCKET_NAME environment variable not set")
+                    logger.info("PAYLOAD_BUCKET_NAME environment variable not set")
                     return response_data
 
                 # Generate a unique key for the payload
-                import uuid
-                from datetime import datetime
                 payload_key = f"payloads/{datetime.now().strftime('%Y-%m-%d')}/{str(uuid.uuid4())}.json"
 
-                # Store the payload in S3
-                s3_client.put_object(
-                    Bucket=payload_bucket,
-                    Key=payload_key,
-                    Body=json.dumps(response_data),
-                    ContentType='application/json'
-                )
+                # Store the payload in S3, gzip-compressed
+                put_json_payload(payload_bucket, payload_key, serialized_response)
 
-                print(f"Stored large response in S3: {payload_bucket}/{payload_key}")
+                logger.info(f"Stored large response in S3: {payload_bucket}/{payload_key}")
 
                 # Return a reference to the stored payload
                 return {
@@ -1128,7 +1752,7 @@ def add_document_to_knowledge_base(event):
                     }
                 }
             except Exception as e:
-                print(f"Error storing large response in S3: {str(e)}")
+                logger.error(f"Error storing large response in S3: {str(e)}")
                 # Fall back to returning the full response
                 return response_data
 
@@ -1136,7 +1760,7 @@ def add_document_to_knowledge_base(event):
         return response_data
 
     except Exception as e:
-        print(f"Error adding document to knowledge base: {str(e)}")
+        logger.error(f"Error adding document to knowledge base: {str(e)}")
         return {
             'statusCode': 500,
             'body': json.dumps({
@@ -1162,30 +1786,25 @@ def query_knowledge_base(event):
                 'body': json.dumps('Missing query parameter')
             }
 
-        # Get the knowledge base configuration from DynamoDB
+        # Get the knowledge base configuration from DynamoDB (cached on warm containers)
         table_name = os.environ.get('METADATA_TABLE_NAME')
-        metadata_table = dynamodb.Table(table_name)
+        metadata_table = get_table(table_name)
 
-        response = metadata_table.query(
-            IndexName='DocumentIdIndex',
-            KeyConditionExpression='document_id = :did',
-            ExpressionAttributeValues={
-                ':did': 'KNOWLEDGE_BASE_CONFIG'
-            }
-        )
+        kb_items = get_kb_config_items(metadata_table)
 
-        if not response['Items']:
+        if not kb_items:
             return {
                 'statusCode': 404,
                 'body': json.dumps('Knowledge base configuration not found')
             }
 
-        kb_config = response['Items'][0]
+        kb_config = kb_items[0]
         kb_id = kb_config['knowledge_base_id']
 
         # Query the knowledge base
-        try:
-            print(f"Retrieving information from knowledge base: {kb_id} with query: {query}")
+        def retrieve_from_knowledge_base():
+            """Retrieve results from the knowledge base, trying the available APIs."""
+            logger.info(f"Retrieving information from knowledge base: {kb_id} with query: {query}")
 
             # Check which API method is available
             if hasattr(bedrock_agent, 'retrieve'):
@@ -1215,12 +1834,12 @@ def query_knowledge_base(event):
                     retrieval_results = retrieve_response['results']
                 else:
                     # Create a fallback structure if no results found
-                    print("No results found in the response. Using empty results.")
+                    logger.info("No results found in the response. Using empty results.")
                     retrieval_results = []
             else:
                 # Try using the Kendra query API directly
-                print("Bedrock knowledge base query methods not available. Falling back to Kendra query.")
-                kendra_client = boto3.client('kendra')
+                logger.info("Bedrock knowledge base query methods not available. Falling back to Kendra query.")
+                kendra_client = get_kendra_client()
                 kendra_index_id = os.environ.get('KENDRA_INDEX_ID')
 
                 if not kendra_index_id:
@@ -1249,30 +1868,40 @@ def query_knowledge_base(event):
                             }
                         })
 
-            print(f"Retrieved {len(retrieval_results)} results")
-        except Exception as retrieve_error:
-            print(f"Error in retrieve call: {str(retrieve_error)}")
-            raise retrieve_error
+            logger.info(f"Retrieved {len(retrieval_results)} results")
+            return retrieval_results
 
         # Get the search index table
         search_index_table_name = os.environ.get('SEARCH_INDEX_TABLE_NAME', table_name)
-        search_index_table = dynamodb.Table(search_index_table_name)
+        search_index_table = get_table(search_index_table_name)
 
-        # Find relevant images based on the query
-        relevant_images = find_relevant_images(query, search_index_table)
+        # The knowledge base retrieval and the image search are independent;
+        # run them concurrently so the query pays max() instead of sum() of
+        # the two round-trip latencies
+        try:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                retrieve_future = executor.submit(retrieve_from_knowledge_base)
+                images_future = executor.submit(find_relevant_images, query, search_index_table)
+                retrieval_results = retrieve_future.result()
+                relevant_images = images_future.result()
+        except Exception as retrieve_error:
+            logger.error(f"Error in retrieve call: {str(retrieve_error)}")
+            raise retrieve_error
 
         # Print information about the found images
-        print(f"Found {len(relevant_images)} relevant images for query: {query}")
+        logger.info(f"Found {len(relevant_images)} relevant images for query: {query}")
         for i, img in enumerate(relevant_images):
-            print(f"Image {i+1}: {img.get('image_description', 'No description')} - Score: {img.get('relevance_score', 0)}")
-            print(f"  URI: {img.get('image_s3_uri', 'No URI')}")
-            print(f"  Has presigned URL: {'Yes' if 'presigned_url' in img else 'No'}")
-            print(f"  Matched terms: {img.get('matched_terms', [])}")
+            logger.info(f"Image {i+1}: {img.get('image_description', 'No description')} - Score: {img.get('relevance_score', 0)}")
+            logger.info(f"  URI: {img.get('image_s3_uri', 'No URI')}")
+            logger.info(f"  Has presigned URL: {'Yes' if 'presigned_url' in img else 'No'}")
+            logger.info(f"  Matched terms: {img.get('matched_terms', [])}")
 
         # Use Bedrock to generate a response based on the retrieved content
 
-        # Prepare the context from retrieved documents
-        context = ""
+        # Prepare the context from retrieved documents, collecting the unique
+        # sources in the same pass instead of re-walking the results later
+        context_parts = []
+        sources = []
         if retrieval_results:
             for result in retrieval_results:
                 # Handle different result formats
@@ -1283,7 +1912,7 @@ def query_knowledge_base(event):
                 elif 'text' in result:
                     content = result['text']
                 else:
-                    print(f"Warning: Unexpected result format: {result}")
+                    logger.warning(f"Warning: Unexpected result format: {result}")
                     content = str(result)
 
                 # Handle different source formats
@@ -1296,23 +1925,29 @@ def query_knowledge_base(event):
                 else:
                     source = 'Unknown source'
 
-                context += f"Source: {source}\nContent: {content}\n\n"
+                if source != 'Unknown source' and source not in sources:
+                    sources.append(source)
+
+                context_parts.append(f"Source: {source}\nContent: {content}\n\n")
         else:
-            context = "No relevant documents found in the knowledge base."
-            print("Warning: No retrieval results found. Using empty context.")
+            context_parts.append("No relevant documents found in the knowledge base.")
+            logger.warning("Warning: No retrieval results found. Using empty context.")
 
         # Add information about relevant images to the context
         if relevant_images:
-            context += "\nRelevant images found:\n"
+            context_parts.append("\nRelevant images found:\n")
             for i, img in enumerate(relevant_images):  # Include all relevant images in the context
                 description = img.get('image_description', f"Image {i+1}")
                 preview = img.get('text_content_preview', 'No text content')
                 score = img.get('relevance_score', 0)
-                context += f"Image {i+1}: {description}\nRelevance Score: {score}\nText content: {preview}\n\n"
+                context_parts.append(f"Image {i+1}: {description}\nRelevance Score: {score}\nText content: {preview}\n\n")
+
+        # Join once instead of growing the string incrementally
+        context = ''.join(context_parts)
 
         # Generate a response using Claude
         try:
-            print("Generating response with Claude")
+            logger.info("Generating response with Claude")
 
             # Create a prompt that includes information about images
             image_instruction = ""
@@ -1329,31 +1964,29 @@ def query_knowledge_base(event):
             # Get the inference profile ARN from environment variable
             inference_profile_arn = get_inference_profile_arn()
 
+            # Only the prompt text is serialized per call; the constant
+            # envelope around it is prebuilt at module scope
+            prompt_text = PROMPT_TEMPLATE.format(
+                query=query,
+                context=context,
+                image_instruction=image_instruction
+            )
+            request_body = (_REQUEST_BODY_PREFIX
+                            + json_dumps(prompt_text).encode('utf-8')
+                            + _REQUEST_BODY_SUFFIX)
+
             if inference_profile_arn:
                 try:
-                    print(f"Using inference profile: {inference_profile_arn}")
-                    # Use the inference profile ARN instead of the direct model ID
-                    response = bedrock_runtime.invoke_model(
+                    logger.info(f"Using inference profile: {inference_profile_arn}")
+                    # Use the inference profile ARN instead of the direct model ID.
+                    # Stream the response so tokens are consumed as they are
+                    # generated instead of blocking on the full completion.
+                    response = bedrock_runtime.invoke_model_with_response_stream(
                         modelId=inference_profile_arn,
-                        body=json.dumps({
-                            'anthropic_version': 'bedrock-2023-05-31',
-                            'max_tokens': 4000,
-                            'temperature': 0.1,
-                            'messages': [
-                                {
-                                    'role': 'user',
-                                    'content': [
-                                        {
-                                            'type': 'text',
-                                            'text': f"I have the following question: {query}\n\nHere is some context that might help you answer:\n\n{context}\n\n{image_instruction}\n\nPlease provide a comprehensive answer based on the context provided. If the context doesn't contain enough information to answer the question, please say so. Include references to the sources in your answer."
-                                        }
-                                    ]
-                                }
-                            ]
-                        })
+                        body=request_body
                     )
                 except Exception as e:
-                    print(f"Error invoking model with inference profile: {str(e)}")
+                    logger.error(f"Error invoking model with inference profile: {str(e)}")
                     # If using the inference profile fails, we need to create one manually
                     error_message = (
                         f"Failed to invoke Claude 3.5 Sonnet with inference profile. "
@@ -1373,42 +2006,38 @@ def query_knowledge_base(event):
                     f"aws bedrock create-inference-profile --inference-profile-name ClaudeInferenceProfile "
                     f"--model-source copyFrom={get_model_arn()}"
                 )
-                print(error_message)
+                logger.error(error_message)
                 raise Exception(error_message)
 
-            # Parse the response for Claude 3.5
-            response_body = json.loads(response['body'].read())
-            answer = response_body.get('content', [{}])[0].get('text', '')
-            print("Generated response successfully using Claude 3.5 Sonnet")
+            # Accumulate the streamed Claude 3.5 response as deltas arrive
+            answer_parts = []
+            for stream_event in response['body']:
+                chunk = json_loads(stream_event['chunk']['bytes'])
+                if chunk.get('type') == 'content_block_delta':
+                    answer_parts.append(chunk['delta'].get('text', ''))
+            answer = ''.join(answer_parts)
+            logger.info("Generated response successfully using Claude 3.5 Sonnet")
         except Exception as model_error:
-            print(f"Error invoking model: {str(model_error)}")
+            logger.error(f"Error invoking model: {str(model_error)}")
             raise model_error
 
-        # Format the images for the response
-        formatted_images = []
-        for i, img in enumerate(relevant_images):
-            formatted_img = {
+        # Format the images for the response in one dict literal per image;
+        # url/direct_url both carry the presigned URL so it works in img tags
+        formatted_images = [
+            {
                 'description': img.get('image_description', 'Image'),
                 'uri': img.get('image_s3_uri', ''),
                 'relevance_score': img.get('relevance_score', 0),
-                'rank': i + 1  # Add rank information (1-based)
+                'rank': i + 1,  # Add rank information (1-based)
+                **({'url': img['presigned_url'], 'direct_url': img['presigned_url']}
+                   if 'presigned_url' in img else {}),
+                **({'text_content': img['text_content_preview']}
+                   if 'text_content_preview' in img else {}),
+                **({'matched_terms': img['matched_terms']}
+                   if 'matched_terms' in img else {})
             }
-
-            # Add presigned URL if available
-            if 'presigned_url' in img:
-                formatted_img['url'] = img['presigned_url']
-                # Also add a direct URL that can be used in img tags
-                formatted_img['direct_url'] = img['presigned_url']
-
-            # Add text content preview
-            if 'text_content_preview' in img:
-                formatted_img['text_content'] = img['text_content_preview']
-
-            # Add matched terms if available
-            if 'matched_terms' in img:
-                formatted_img['matched_terms'] = img['matched_terms']
-
-            formatted_images.append(formatted_img)
+            for i, img in enumerate(relevant_images)
+        ]
 
         # Create a structured response that includes image references inline
         structured_response = create_structured_response(answer, formatted_images)
@@ -1419,7 +2048,7 @@ def query_knowledge_base(event):
             'body': json.dumps({
                 'query': query,
                 'answer': answer,
-                'sources': get_sources_from_results(retrieval_results),
+                'sources': sources or ['No sources found'],
                 'has_images': len(formatted_images) > 0,
                 'image_count': len(formatted_images),
                 'images': formatted_images,
@@ -1427,9 +2056,11 @@ def query_knowledge_base(event):
             }, default=str)  # Use default=str to handle any non-serializable objects
         }
 
-        # Estimate the size of the response
-        response_size = len(json.dumps(response_data))
-        print(f"Estimated response size: {response_size} bytes")
+        # Serialize once; the same string feeds both the size check and,
+        # when offloading, the S3 body
+        serialized_response = json_dumps(response_data)
+        response_size = len(serialized_response)
+        logger.info(f"Estimated response size: {response_size} bytes")
 
         # If the response is too large (over 200KB), store it in S3
         if response_size > 200000:
@@ -1437,23 +2068,16 @@ def query_knowledge_base(event):
                 # Get the payload bucket name
                 payload_bucket = os.environ.get('PAYLOAD_BUCKET_NAME')
                 if not payload_bucket:
-                    print("PAYLOAD_BUCKET_NAME environment variable not set")
+                    logger.info("PAYLOAD_BUCKET_NAME environment variable not set")
                     return response_data
 
                 # Generate a unique key for the payload
-                import uuid
-                from datetime import datetime
                 payload_key = f"payloads/{datetime.now().strftime('%Y-%m-%d')}/{str(uuid.uuid4())}.json"
 
-                # Store the payload in S3
-                s3_client.put_object(
-                    Bucket=payload_bucket,
-                    Key=payload_key,
-                    Body=json.dumps(response_data),
-                    ContentType='application/json'
-                )
+                # Store the payload in S3, gzip-compressed
+                put_json_payload(payload_bucket, payload_key, serialized_response)
 
-                print(f"Stored large response in S3: {payload_bucket}/{payload_key}")
+                logger.info(f"Stored large response in S3: {payload_bucket}/{payload_key}")
 
                 # Return a reference to the stored payload
                 return {
@@ -1464,7 +2088,7 @@ def query_knowledge_base(event):
                     }
                 }
             except Exception as e:
-                print(f"Error storing large response in S3: {str(e)}")
+                logger.error(f"Error storing large response in S3: {str(e)}")
                 # Fall back to returning the full response
                 return response_data
 
@@ -1472,7 +2096,7 @@ def query_knowledge_base(event):
         return response_data
 
     except Exception as e:
-        print(f"Error querying knowledge base: {str(e)}")
+        logger.error(f"Error querying knowledge base: {str(e)}")
         return {
             'statusCode': 500,
             'body': json.dumps({
@@ -1480,166 +2104,154 @@ def query_knowledge_base(event):
             })
         }
 
-def get_sources_from_results(retrieval_results):
-    """Extract source information from retrieval results in different formats."""
-    sources = []
-    if not retrieval_results:
-        return sources
-
-    for result in retrieval_results:
-        source = None
-        # Handle different source formats
-        if 'location' in result and 's3Location' in result['location']:
-            source = result['location']['s3Location'].get('uri')
-        elif 'documentURI' in result:
-            source = result.get('documentURI')
-        elif 'source' in result:
-            source = result['source']
-
-        if source and source not in sources:
-            sources.append(source)
-
-    return sources or ['No sources found']
-
-def calculate_image_relevance(query_terms, index_value, index_type, index=None):
+def calculate_image_relevance(query_terms, index_value_lower, index_type, index=None,
+                              query_phrase=None):
     """Calculate a more sophisticated relevance score for an image.
 
     Args:
         query_terms: List of query terms to match
-        index_value: The text content to match against
+        index_value_lower: The text content to match against, already lowercased
         index_type: The type of index (embedded_image, qa_image, etc.)
         index: The full index object, which may contain Q&A information
+        query_phrase: Pre-joined query terms; joined here when not supplied
     """
     score = 0
-    matched_terms = set()
+    query_term_set = set(query_terms)
+
+    # Callers lowercase once up front, so tokenize directly; matches then
+    # come from C-level set intersections instead of a scan per term
+    tokens = tokenize_lower(index_value_lower)
 
     # Check if this is a Q&A image
     is_qa_image = index_type in ['qa_image', 'qa_pdf_page']
 
     # If this is a Q&A image, check if the query matches the question
+    matched_terms = set()
     if is_qa_image and index and 'question' in index:
         question = index.get('question', '').lower()
-        answer = index.get('answer', '').lower()
-
-        # Check if any query term is in the question
-        question_match = False
-        for term in query_terms:
-            if term in question:
-                question_match = True
-                matched_terms.add(term)
+        question_matches = query_term_set & set(tokenize_lower(question))
 
         # If the query matches the question, give a high score
-        if question_match:
+        if question_matches:
+            matched_terms |= question_matches
             score += 10  # High priority for Q&A matches
-            print(f"Q&A match found! Question: {question[:50]}...")
+            logger.info(f"Q&A match found! Question: {question[:50]}...")
 
-    # Base score from term matches in the index value
-    for term in query_terms:
-        if term in index_value.lower():
-            # Weight based on index type
-            if index_type == 'qa_image':
-                score += 5  # Highest weight for Q&A images
-            elif index_type == 'qa_pdf_page':
-                score += 4  # High weight for Q&A PDF pages
-            elif index_type == 'embedded_image':
-                score += 3  # Higher weight for direct image text
-            elif index_type == 'image_content':
-                score += 2  # Medium weight for image content
-            else:
-                score += 1  # Lower weight for section matches
-
-            matched_terms.add(term)
+    # Base score from term matches in the index value, weighted by index type
+    value_matches = query_term_set & set(tokens)
+    score += _INDEX_TYPE_WEIGHTS.get(index_type, 1) * len(value_matches)
+    matched_terms |= value_matches
 
     # Boost score based on term density
-    if len(index_value) > 0:
-        term_density = len(matched_terms) / (len(index_value.split()) + 1)
+    if tokens:
+        term_density = len(matched_terms) / (len(tokens) + 1)
         score += term_density * 5
 
-    # Boost score based on consecutive term matches
-    consecutive_matches = find_consecutive_matches(query_terms, index_value.lower())
-    score += consecutive_matches * 2
+    # Boost score based on consecutive term matches; a phrase match needs
+    # every one of its terms matched (capped at two, since any longer phrase
+    # hit implies at least two), so the scan is skipped outright below that
+    if len(matched_terms) >= min(2, len(query_terms)):
+        if query_phrase is None:
+            query_phrase = ' '.join(query_terms)
+        # Search the normalized token stream so punctuation between words
+        # doesn't break a phrase hit; the batch scorer matches against the
+        # same normalized form
+        score += find_consecutive_matches(query_phrase, ' '.join(tokens),
+                                          len(query_terms)) * 2
 
     return score, matched_terms
 
-def find_consecutive_matches(query_terms, text):
-    """Find consecutive term matches in text."""
-    consecutive_count = 0
-    query_phrase = ' '.join(query_terms)
+# Only the attributes the scoring and result-building code actually reads;
+# projecting them keeps the returned bytes (and RCUs) per item small
+IMAGE_INDEX_PROJECTION = ('image_s3_uri, index_value, index_value_lower, index_tokens, '
+                          'text_content_preview, index_type, document_id, '
+                          'extracted_image_s3_uri, image_description, '
+                          'image_position, question, answer')
 
-    if query_phrase in text:
-        consecutive_count += len(query_terms)
+def query_image_indices(search_index_table, index_type, max_items=1000):
+    """Query indices of one type via the sparse ImageIndex GSI, following pagination.
 
-    return consecutive_count
+    ImageIndex is keyed on index_type + image_s3_uri, so rows without an
+    image URI are never written to it — no post-read filter is needed.
+    Fetches at most max_items items so worst-case latency stays bounded as
+    the table grows.
+    """
+    items = []
+    query_kwargs = {
+        'IndexName': 'ImageIndex',
+        'KeyConditionExpression': Key('index_type').eq(index_type),
+        'ProjectionExpression': IMAGE_INDEX_PROJECTION,
+        'Limit': 500
+    }
+    while len(items) < max_items:
+        response = search_index_table.query(**query_kwargs)
+        items.extend(response.get('Items', []))
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        if not last_evaluated_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_evaluated_key
+    return items[:max_items]
 
 def find_relevant_images(query, search_index_table):
     """Find images that are relevant to the query based on their text content."""
     try:
-        print(f"Finding relevant images for query: {query}")
+        logger.info(f"Finding relevant images for query: {query}")
 
-        # First, scan for image content indices
+        # First, query for image content indices
         image_indices = []
 
         # Get all image types in a single list using a helper function
         # Include 'pdf_page_image' type to find PDF page references that have extracted images
         image_types = ['image_content', 'embedded_image', 'embedded_image_section', 'pdf_page_image']
-        for index_type in image_types:
-            try:
-                # First try a query on the index type
-                response = search_index_table.scan(
-                    FilterExpression='attribute_exists(image_s3_uri) AND index_type = :type',
-                    ExpressionAttributeValues={
-                        ':type': index_type
-                    }
-                )
-                type_indices = response.get('Items', [])
-                print(f"Found {len(type_indices)} {index_type} indices")
-
-                # If we didn't find any indices, try a more general scan
-                if not type_indices:
-                    print(f"No {index_type} indices found with image_s3_uri, trying general scan")
-                    response = search_index_table.scan(
-                        FilterExpression='index_type = :type',
-                        ExpressionAttributeValues={
-                            ':type': index_type
-                        }
-                    )
-                    type_indices = response.get('Items', [])
-                    print(f"Found {len(type_indices)} {index_type} indices with general scan")
 
-                image_indices.extend(type_indices)
+        def _query_type(index_type):
+            # Each per-type GSI query is an independent round trip, so fan
+            # them out and pay only the slowest one in wall time
+            try:
+                return query_image_indices(search_index_table, index_type)
             except Exception as e:
-                print(f"Error scanning for {index_type} indices: {str(e)}")
+                logger.error(f"Error querying for {index_type} indices: {str(e)}")
+                return []
 
-        print(f"Total image indices found: {len(image_indices)}")
+        for index_type, type_indices in zip(image_types, _EXEC.map(_query_type, image_types)):
+            logger.info(f"Found {len(type_indices)} {index_type} indices")
+            image_indices.extend(type_indices)
 
-        # Debug: Print some sample indices to understand their structure
-        if image_indices:
-            print("Sample image index:")
+        logger.info(f"Total image indices found: {len(image_indices)}")
+
+        # Debug: Log some sample indices to understand their structure
+        if image_indices and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sample image index:")
             sample_index = image_indices[0]
             for key, value in sample_index.items():
-                print(f"  {key}: {value}")
+                logger.debug(f"  {key}: {value}")
 
         # If we have no images, return empty list
         if not image_indices:
-            print("No image indices found in the database")
+            logger.info("No image indices found in the database")
             return []
 
         # Prepare query terms for matching
-        query_terms = [term.lower() for term in query.split() if len(term) > 3]  # Only use terms with more than 3 chars
-        print(f"Query terms for matching: {query_terms}")
+        query_terms = [term for term in tokenize_lower(query.lower()) if len(term) > 3]  # Only use terms with more than 3 chars
+        query_term_set = set(query_terms)  # Precomputed once for the fast-path set intersection below
+        query_phrase = ' '.join(query_terms)  # Joined once instead of per scored image
+        logger.info(f"Query terms for matching: {query_terms}")
 
         # Score images based on relevance to the query
         image_scores = {}
         extracted_image_map = {}  # Map PDF page URIs to their extracted image URIs
+        batch_jobs = []  # (image_s3_uri, index_value, index_type) scored vectorized below
 
         for index in image_indices:
-            index_value = index.get('index_value', '').lower()
+            # Rows indexed with a precomputed lowercase value skip the
+            # per-query str.lower() over potentially multi-KB content
+            index_value = index.get('index_value_lower') or index.get('index_value', '').lower()
             image_s3_uri = index.get('image_s3_uri', '')
 
             # If this is a PDF page with an extracted image, store the mapping
             if index.get('index_type') == 'pdf_page_image' and 'extracted_image_s3_uri' in index:
                 extracted_image_map[image_s3_uri] = index['extracted_image_s3_uri']
-                print(f"Found PDF page with extracted image: {image_s3_uri} -> {index['extracted_image_s3_uri']}")
+                logger.info(f"Found PDF page with extracted image: {image_s3_uri} -> {index['extracted_image_s3_uri']}")
 
             if not image_s3_uri:
                 continue
@@ -1652,75 +2264,130 @@ def find_relevant_images(query, search_index_table):
                     'matched_terms': set()
                 }
 
-            # Calculate score using the enhanced relevance function
-            score, matched_terms = calculate_image_relevance(
-                query_terms,
-                index_value,
-                index.get('index_type', ''),
-                index  # Pass the full index object for Q&A matching
-            )
+            # Fast pre-filter: a C-level token-set intersection catches whole-word
+            # matches cheaply, and rows indexed with a precomputed token set
+            # skip the tokenization entirely. A row with no token overlap and
+            # no question can only score zero, so nothing else needs checking.
+            row_tokens = index.get('index_tokens') or set(tokenize_lower(index_value))
+            if not (query_term_set & row_tokens) and 'question' not in index:
+                # Keep the zero-score entry so the no-match fallback path still works
+                continue
 
-            # Add to the existing score
-            image_scores[image_s3_uri]['score'] += score
+            # Q&A rows need the full index object for question matching and
+            # go through the scalar scorer; everything else accumulates into
+            # one vectorized scoring pass over the whole candidate set
+            if 'question' in index:
+                score, matched_terms = calculate_image_relevance(
+                    query_terms,
+                    index_value,
+                    index.get('index_type', ''),
+                    index,  # Pass the full index object for Q&A matching
+                    query_phrase=query_phrase
+                )
+                image_scores[image_s3_uri]['score'] += score
+                image_scores[image_s3_uri]['matched_terms'].update(matched_terms)
+            else:
+                batch_jobs.append((image_s3_uri, index_value, index.get('index_type', '')))
 
-            # Add matched terms
-            for term in matched_terms:
-                image_scores[image_s3_uri]['matched_terms'].add(term)
+        if batch_jobs:
+            batch_scores, batch_matched = calculate_image_relevance_batch(
+                query_terms,
+                [value for _, value, _ in batch_jobs],
+                [index_type for _, _, index_type in batch_jobs]
+            )
+            for (image_s3_uri, _, _), score, matched_terms in zip(batch_jobs, batch_scores, batch_matched):
+                image_scores[image_s3_uri]['score'] += score
+                image_scores[image_s3_uri]['matched_terms'].update(matched_terms)
 
-        # Sort images by score (descending)
-        sorted_images = sorted(
-            image_scores.items(),
-            key=lambda x: x[1]['score'],
-            reverse=True
-        )
+        # Only a handful of images survive selection, so take the top
+        # entries with bounded heaps instead of sorting every scored image
+        top_overall = heapq.nlargest(5, image_scores.items(),
+                                     key=lambda x: x[1]['score'])
 
-        print(f"Found {len(sorted_images)} images with non-zero scores")
+        logger.info(f"Scored {len(image_scores)} images")
 
-        # Debug: Print the top scoring images
-        for i, (image_uri, score_data) in enumerate(sorted_images[:3]):
-            if i == 0:
-                print(f"Top scoring image: {image_uri}")
-                print(f"Score: {score_data['score']}")
-                print(f"Matched terms: {score_data['matched_terms']}")
-                print(f"Index type: {score_data['index'].get('index_type', 'unknown')}")
+        # Debug: Print the top scoring image
+        if top_overall:
+            top_uri, top_data = top_overall[0]
+            logger.info(f"Top scoring image: {top_uri}")
+            logger.info(f"Score: {top_data['score']}")
+            logger.info(f"Matched terms: {top_data['matched_terms']}")
+            logger.info(f"Index type: {top_data['index'].get('index_type', 'unknown')}")
 
         # Take up to top 5 images if their scores are greater than a threshold
         top_images = []
         relevance_threshold = 5  # Minimum score to consider an image relevant
 
         # First, check for any Q&A images with high scores
-        qa_images = [img for img in sorted_images if img[1]['index'].get('index_type') in ['qa_image', 'qa_pdf_page'] and img[1]['score'] > relevance_threshold]
+        qa_top = heapq.nlargest(
+            5,
+            (img for img in image_scores.items()
+             if img[1]['index'].get('index_type') in ['qa_image', 'qa_pdf_page']
+             and img[1]['score'] > relevance_threshold),
+            key=lambda x: x[1]['score']
+        )
 
-        if qa_images:
+        if qa_top:
             # If we have Q&A images, prioritize them but still include regular images if needed
-            qa_top = qa_images[:5]  # Take up to 5 Q&A images
-
-            # If we have fewer than 5 Q&A images, add regular images to reach 5 total
-            if len(qa_top) < 5 and sorted_images:
-                # Get regular images not already in qa_top
-                regular_images = [img for img in sorted_images if img not in qa_top and img[1]['score'] > relevance_threshold]
-                # Add enough to reach 5 total
-                regular_top = regular_images[:5-len(qa_top)]
-                top_images = qa_top + regular_top
+            if len(qa_top) < 5:
+                # Fill from the overall top 5: any above-threshold candidate
+                # outside it is dominated by an above-threshold one inside it
+                regular_images = [img for img in top_overall if img not in qa_top and img[1]['score'] > relevance_threshold]
+                top_images = qa_top + regular_images[:5-len(qa_top)]
             else:
                 top_images = qa_top
 
-            print(f"Selected {len(qa_top)} Q&A images and {len(top_images) - len(qa_top)} regular images with scores: {[img[1]['score'] for img in top_images]}")
-        elif sorted_images:
+            logger.info(f"Selected {len(qa_top)} Q&A images and {len(top_images) - len(qa_top)} regular images with scores: {[img[1]['score'] for img in top_images]}")
+        elif top_overall:
             # Take up to 5 images with scores above the threshold
-            top_images = [img for img in sorted_images[:5] if img[1]['score'] > relevance_threshold]
+            top_images = [img for img in top_overall if img[1]['score'] > relevance_threshold]
 
             # If we don't have enough images above threshold, take the top 5 regardless of threshold
-            if not top_images and sorted_images:
-                top_images = sorted_images[:5]
-                print(f"No images above threshold, selecting top 5 images with scores: {[img[1]['score'] for img in top_images]}")
+            if not top_images:
+                top_images = top_overall
+                logger.info(f"No images above threshold, selecting top 5 images with scores: {[img[1]['score'] for img in top_images]}")
             else:
-                print(f"Selected {len(top_images)} images with scores above threshold: {[img[1]['score'] for img in top_images]}")
+                logger.info(f"Selected {len(top_images)} images with scores above threshold: {[img[1]['score'] for img in top_images]}")
         else:
-            print("No images found with scores.")
+            logger.info("No images found with scores.")
+
+        # Prefetch Q&A metadata for every selected image that needs it. The
+        # lookup goes through the DocumentIdIndex GSI, so BatchGetItem (which
+        # needs table primary keys) can't serve it; fan the per-document
+        # queries out instead of issuing them one at a time inside the loop.
+        qa_doc_ids = sorted({
+            score_data['index']['document_id']
+            for _, score_data in top_images
+            if score_data['index'].get('document_id')
+            and not (score_data['index'].get('index_type') in ['qa_image', 'qa_pdf_page']
+                     and 'question' in score_data['index'])
+        })
+        metadata_by_doc_id = {}
+        if qa_doc_ids:
+            metadata_table = get_table(os.environ.get('METADATA_TABLE_NAME'))
+
+            def _fetch_metadata(doc_id):
+                try:
+                    response = metadata_table.query(
+                        IndexName='DocumentIdIndex',
+                        KeyConditionExpression='document_id = :did',
+                        ExpressionAttributeValues={
+                            ':did': doc_id
+                        },
+                        ProjectionExpression='document_id, qa_pairs, qa_pairs_sample, qa_pairs_s3_key, qa_pairs_s3_bucket',
+                        Limit=1
+                    )
+                    items = response.get('Items')
+                    return doc_id, items[0] if items else None
+                except Exception as e:
+                    logger.error(f"Error retrieving Q&A metadata for {doc_id}: {str(e)}")
+                    return doc_id, None
+
+            metadata_by_doc_id = dict(_EXEC.map(_fetch_metadata, qa_doc_ids))
 
         # Create the result list with image details
         relevant_images = []
+        presign_jobs = []  # (image_info, bucket, key, page_ref) tuples signed in parallel below
         processed_uris = set()  # Track which URIs we've already processed
 
         for image_uri, score_data in top_images: # This loop will now run at most once
@@ -1735,25 +2402,26 @@ def find_relevant_images(query, search_index_table):
             # Also check if the index itself has an extracted image URI
             if not extracted_image_uri and 'extracted_image_s3_uri' in index:
                 extracted_image_uri = index['extracted_image_s3_uri']
-                print(f"Found extracted image URI in index: {extracted_image_uri}")
+                logger.info(f"Found extracted image URI in index: {extracted_image_uri}")
 
             # If we have an extracted image, use that instead of the PDF page
             primary_uri = extracted_image_uri if extracted_image_uri else image_uri
 
             # Skip if we've already processed this URI
             if primary_uri in processed_uris:
-                print(f"Skipping already processed URI: {primary_uri}")
+                logger.info(f"Skipping already processed URI: {primary_uri}")
                 continue
 
             processed_uris.add(primary_uri)
-            print(f"Processing image URI: {primary_uri}")
+            logger.info(f"Processing image URI: {primary_uri}")
 
             # Get the image details
             image_info = {
                 'image_s3_uri': primary_uri,
                 'document_id': index.get('document_id', ''),
                 'image_description': index.get('image_description', ''),
-                'text_content_preview': index_value[:100] + '...' if len(index_value) > 100 else index_value,
+                'text_content_preview': index.get('text_content_preview') or (
+                    index_value[:100] + '...' if len(index_value) > 100 else index_value),
                 'relevance_score': score_data['score'],
                 'matched_terms': list(score_data['matched_terms'])
             }
@@ -1763,30 +2431,20 @@ def find_relevant_images(query, search_index_table):
                 image_info['question'] = index.get('question', '')
                 image_info['answer'] = index.get('answer', '')
                 image_info['is_qa_image'] = True
-                print(f"Adding Q&A information to image: Question: {index.get('question', '')[:50]}...")
+                logger.info(f"Adding Q&A information to image: Question: {index.get('question', '')[:50]}...")
             # If we don't have Q&A info in the index but have document_id, try to get it from the metadata table
             elif 'document_id' in index:
                 try:
-                    # Get the metadata item from DynamoDB
-                    metadata_table = dynamodb.Table(os.environ.get('METADATA_TABLE_NAME'))
-                    response = metadata_table.query(
-                        IndexName='DocumentIdIndex',
-                        KeyConditionExpression='document_id = :did',
-                        ExpressionAttributeValues={
-                            ':did': index.get('document_id')
-                        }
-                    )
-
-                    if response['Items']:
-                        metadata_item = response['Items'][0]
-
+                    # Use the metadata item prefetched above for this document
+                    metadata_item = metadata_by_doc_id.get(index.get('document_id'))
+                    if metadata_item:
                         # Check if we have Q&A pairs in the metadata
                         if 'qa_pairs' in metadata_item:
                             qa_pairs = metadata_item['qa_pairs']
-                            print(f"Found {len(qa_pairs)} Q&A pairs in metadata")
+                            logger.info(f"Found {len(qa_pairs)} Q&A pairs in metadata")
                         elif 'qa_pairs_sample' in metadata_item:
                             qa_pairs = metadata_item['qa_pairs_sample']
-                            print(f"Using {len(qa_pairs)} sample Q&A pairs from metadata")
+                            logger.info(f"Using {len(qa_pairs)} sample Q&A pairs from metadata")
                         elif 'qa_pairs_s3_key' in metadata_item and 'qa_pairs_s3_bucket' in metadata_item:
                             # Retrieve Q&A pairs from S3
                             try:
@@ -1794,10 +2452,10 @@ def find_relevant_images(query, search_index_table):
                                     Bucket=metadata_item['qa_pairs_s3_bucket'],
                                     Key=metadata_item['qa_pairs_s3_key']
                                 )
-                                qa_pairs = json.loads(qa_s3_response['Body'].read().decode('utf-8'))
-                                print(f"Retrieved {len(qa_pairs)} Q&A pairs from S3")
+                                qa_pairs = json_loads(qa_s3_response['Body'].read())
+                                logger.info(f"Retrieved {len(qa_pairs)} Q&A pairs from S3")
                             except Exception as e:
-                                print(f"Error retrieving Q&A pairs from S3: {str(e)}")
+                                logger.error(f"Error retrieving Q&A pairs from S3: {str(e)}")
                                 qa_pairs = []
                         else:
                             qa_pairs = []
@@ -1824,79 +2482,77 @@ def find_relevant_images(query, search_index_table):
                                     image_info['question'] = qa_pair.get('question', '')
                                     image_info['answer'] = qa_pair.get('answer', '')
                                     image_info['is_qa_image'] = True
-                                    print(f"Found matching Q&A for image: Question: {qa_pair.get('question', '')[:50]}...")
+                                    logger.info(f"Found matching Q&A for image: Question: {qa_pair.get('question', '')[:50]}...")
                                     break
                 except Exception as e:
-                    print(f"Error retrieving Q&A information from metadata: {str(e)}")
+                    logger.error(f"Error retrieving Q&A information from metadata: {str(e)}")
 
             # If we're using an extracted image, also store the original PDF page URI
             if extracted_image_uri:
                 image_info['pdf_page_uri'] = image_uri
-                print(f"Using extracted image {extracted_image_uri} instead of PDF page {image_uri}")
-
-            # Add any additional metadata from the index
-            for key, value in index.items():
-                if key not in image_info and key not in ['id', 'document_id', 'metadata_id', 'index_type', 'index_value', 'created_at']:
-                    image_info[key] = value
+                logger.info(f"Using extracted image {extracted_image_uri} instead of PDF page {image_uri}")
 
             # Add position information if available
             if 'image_position' in index:
                 image_info['position'] = index['image_position']
 
-            # Generate a presigned URL for the image if it's in S3
+            # Queue presigned URL generation for the image if it's in S3;
+            # the actual signing runs in parallel after the loop
             if image_info['image_s3_uri'].startswith('s3://'):
                 parts = image_info['image_s3_uri'].replace('s3://', '').split('/', 1)
                 if len(parts) == 2:
                     bucket, key = parts
                     # Verify that both bucket and key are non-empty
                     if bucket and key:
-                        try:
-                            # Handle PDF page references
-                            page_ref = None
-                            if '#page=' in key:
-                                key_parts = key.split('#page=')
-                                key = key_parts[0]
-                                if len(key_parts) > 1:
-                                    page_ref = key_parts[1]
-
-                            # Generate presigned URL with CORS headers
-                            presigned_url = s3_client.generate_presigned_url(
-                                'get_object',
-                                Params={
-                                    'Bucket': bucket,
-                                    'Key': key
-                                    # 'ResponseContentDisposition': f'inline; filename="{os.path.basename(key)}"',
-                                    # 'ResponseContentType': get_content_type(key)
-                                },
-                                ExpiresIn=60  # URL valid for 60 seconds - FOR DEBUGGING
-                            )
-
-                            # Add page reference back if it was a PDF
-                            if page_ref:
-                                presigned_url += f"#page={page_ref}"
-
-                            image_info['presigned_url'] = presigned_url
-                            # Also add a direct URL field for easier client rendering
-                            image_info['direct_url'] = presigned_url
-                            print(f"Generated presigned URL for image {image_info['image_s3_uri']}: {presigned_url}") # Log the full URL
-                        except Exception as e:
-                            print(f"Error generating presigned URL for {image_info['image_s3_uri']}: {str(e)}")
+                        # Handle PDF page references
+                        page_ref = None
+                        if '#page=' in key:
+                            key_parts = key.split('#page=')
+                            key = key_parts[0]
+                            if len(key_parts) > 1:
+                                page_ref = key_parts[1]
+
+                        presign_jobs.append((image_info, bucket, key, page_ref))
                     else:
-                        print(f"Warning: Empty bucket or key in S3 URI: {image_info['image_s3_uri']}")
+                        logger.warning(f"Warning: Empty bucket or key in S3 URI: {image_info['image_s3_uri']}")
 
             relevant_images.append(image_info)
 
-        print(f"Returning {len(relevant_images)} relevant images")
+        # Generate presigned URLs in parallel; each presign is an independent
+        # local SigV4 signing call, so threads cut the wall time when several
+        # images matched the query
+        def _presign(job):
+            image_info, bucket, key, page_ref = job
+            try:
+                # Generate presigned URL with CORS headers via the shared signer
+                presigned_url = presign_get_object(bucket, key, expires_in=60)  # URL valid for 60 seconds - FOR DEBUGGING
 
-        # Debug: Print the first image's details
-        if relevant_images:
-            print("First relevant image details:")
+                # Add page reference back if it was a PDF
+                if page_ref:
+                    presigned_url += f"#page={page_ref}"
+
+                image_info['presigned_url'] = presigned_url
+                # Also add a direct URL field for easier client rendering
+                image_info['direct_url'] = presigned_url
+                logger.info(f"Generated presigned URL for image {image_info['image_s3_uri']}: {presigned_url}") # Log the full URL
+            except Exception as e:
+                logger.error(f"Error generating presigned URL for {image_info['image_s3_uri']}: {str(e)}")
+
+        if presign_jobs:
+            with ThreadPoolExecutor(max_workers=min(8, len(presign_jobs))) as executor:
+                list(executor.map(_presign, presign_jobs))
+
+        logger.info(f"Returning {len(relevant_images)} relevant images")
+
+        # Debug: Log the first image's details
+        if relevant_images and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("First relevant image details:")
             for key, value in relevant_images[0].items():
                 if key not in ['presigned_url', 'direct_url']:
-                    print(f"  {key}: {value}")
+                    logger.debug(f"  {key}: {value}")
 
         return relevant_images
 
     except Exception as e:
-        print(f"Error finding relevant images: {str(e)}")
+        logger.error(f"Error finding relevant images: {str(e)}")
         return []
@@ -1,5 +1,6 @@
 import json
 import os
+import string
 import boto3
 import uuid
 from datetime import datetime
@@ -655,6 +656,32 @@ def lambda_handler(event, context):
             })
         }
 
+def put_search_index_item(table, item):
+    """Store a search index item with precomputed query-time derivatives.
+
+    The lowercased value, its unique tokens, and the short preview are all
+    computed once here so query-time matching can read them directly
+    instead of re-deriving them for every row on every query. Only the
+    stored item carries the derivatives; the caller's dict is left
+    untouched because the handler embeds the same dicts in its response
+    and a DynamoDB set is not JSON-serializable.
+    """
+    index_value = item.get('index_value', '')
+    index_value_lower = index_value.lower()
+    stored_item = dict(item)
+    # Trim edge punctuation per token, mirroring tokenize_lower in the
+    # knowledge-base Lambda, so "capacity?" in prose still matches the
+    # query term "capacity" at search time
+    tokens = {token for token in (raw.strip(string.punctuation)
+                                  for raw in index_value_lower.split()) if token}
+    if tokens:
+        stored_item['index_tokens'] = tokens
+    if index_value:
+        stored_item['index_value_lower'] = index_value_lower
+        stored_item['text_content_preview'] = (index_value[:100] + '...'
+                                               if len(index_value) > 100 else index_value)
+    table.put_item(Item=stored_item)
+
 def create_search_indices(metadata_item, document_content):
     """Create search indices for the document to improve searchability."""
     # Get the DynamoDB table for search indices
@@ -694,7 +721,7 @@ def create_search_indices(metadata_item, document_content):
         }
 
         # Add the search index to DynamoDB
-        table.put_item(Item=index_item)
+        put_search_index_item(table, index_item)
         search_indices.append(index_item)
 
     return search_indices
@@ -802,7 +829,7 @@ def create_image_search_indices(metadata_item, document_content):
         }
 
         # Add the search index to DynamoDB
-        table.put_item(Item=index_item)
+        put_search_index_item(table, index_item)
         search_indices.append(index_item)
 
     # For documents with embedded images, create indices for each image
@@ -894,7 +921,7 @@ def create_image_search_indices(metadata_item, document_content):
 
         # Add the search index to DynamoDB
         try:
-            table.put_item(Item=index_item)
+            put_search_index_item(table, index_item)
             print(f"Successfully added index {index_id} to DynamoDB")
             search_indices.append(index_item)
         except Exception as e:
@@ -925,7 +952,7 @@ def create_image_search_indices(metadata_item, document_content):
                 pdf_index_item['index_type'] = 'qa_pdf_page'
 
             # Add the PDF page index to DynamoDB
-            table.put_item(Item=pdf_index_item)
+            put_search_index_item(table, pdf_index_item)
             search_indices.append(pdf_index_item)
 
         # Create additional indices for different sections of text if the document is long
@@ -958,7 +985,7 @@ def create_image_search_indices(metadata_item, document_content):
 
                 # Add the section index to DynamoDB
                 try:
-                    table.put_item(Item=section_index_item)
+                    put_search_index_item(table, section_index_item)
                     print(f"Successfully added section index {section_index_id} to DynamoDB")
                     search_indices.append(section_index_item)
                 except Exception as e:
@@ -1,3 +1,4 @@
+import gzip
 import json
 import os
 import boto3
@@ -80,9 +81,12 @@ def retrieve_payload(event):
                 'body': json.dumps('Missing bucket or key in payload_reference')
             }
         
-        # Retrieve the payload from S3
+        # Retrieve the payload from S3, decompressing gzip-encoded objects
         response = s3_client.get_object(Bucket=bucket, Key=key)
-        payload = json.loads(response['Body'].read().decode('utf-8'))
+        body = response['Body'].read()
+        if response.get('ContentEncoding') == 'gzip':
+            body = gzip.decompress(body)
+        payload = json.loads(body.decode('utf-8'))
         
         # Return the retrieved payload
         return {
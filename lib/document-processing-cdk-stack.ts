@@ -125,6 +125,16 @@ export class DocumentProcessingCdkStack extends cdk.Stack {
       projectionType: dynamodb.ProjectionType.ALL,
     });
 
+    // Sparse GSI for image lookups: rows without image_s3_uri never enter
+    // the index, so image queries pay RCU only for image rows instead of
+    // filtering them out after the read
+    this.searchIndexTable.addGlobalSecondaryIndex({
+      indexName: 'ImageIndex',
+      partitionKey: { name: 'index_type', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'image_s3_uri', type: dynamodb.AttributeType.STRING },
+      projectionType: dynamodb.ProjectionType.ALL,
+    });
+
     // Lambda role with permissions for Textract, S3, and Bedrock
     const textractProcessorRole = new iam.Role(this, 'TextractProcessorRole', {
       assumedBy: new iam.ServicePrincipal('lambda.amazonaws.com'),
@@ -427,6 +437,9 @@ export class DocumentProcessingCdkStack extends cdk.Stack {
     // Lambda function for Bedrock knowledge base integration
     const bedrockKnowledgeBaseLambda = new lambda.Function(this, 'BedrockKnowledgeBaseFunction', {
       runtime: lambda.Runtime.PYTHON_3_9,
+      // Pure boto3/network workload, so Graviton2 gives better price/perf
+      // with no native-dependency concerns
+      architecture: lambda.Architecture.ARM_64,
       handler: 'bedrock-knowledge-base.lambda_handler',
       code: lambda.Code.fromAsset('lambda'),
       timeout: cdk.Duration.minutes(10),
@@ -439,12 +452,34 @@ export class DocumentProcessingCdkStack extends cdk.Stack {
         KNOWLEDGE_BASE_ROLE_ARN: bedrockKnowledgeBaseRole.roleArn,
         PAYLOAD_BUCKET_NAME: this.payloadBucket.bucketName,
         AUTO_CREATE_KNOWLEDGE_BASE: 'true',
+        // The state machine proceeds whether or not ingestion has finished,
+        // so polling for completion inside the Lambda is billed idle time
+        WAIT_FOR_INGESTION: 'false',
         KENDRA_INDEX_ID: '4c9190f6-671c-4508-a524-a180433c2774', // Your Kendra index ID
         KENDRA_S3_BUCKET: 'aseekbot-poc-kb', // Kendra S3 data source bucket
         // CLAUDE_INFERENCE_PROFILE_ARN: '', // Explicitly unset or remove if not using a specific profile for this function
       },
     });
 
+    // Keep a small pool of pre-initialized instances so p99 query latency
+    // isn't dominated by cold starts; all module-scope init (boto3 clients,
+    // KB config prefetch) runs before the instance is marked ready.
+    //
+    // Note: the pdf-image layer created by createPdfImageLayer below is
+    // attached out-of-band via UpdateFunctionConfiguration on $LATEST after
+    // this version is published, so invocations through the alias
+    // intentionally run without it. That is fine for this function — its
+    // optional imports (orjson, ijson, numpy, ...) all have stdlib
+    // fallbacks and the layer is built for x86 while this function is
+    // arm64 — but bundling those packages for the alias would need a
+    // CFN-managed arm64 LayerVersion attached before currentVersion is
+    // published, not the custom-resource path.
+    const bedrockKnowledgeBaseAlias = new lambda.Alias(this, 'BedrockKnowledgeBaseLiveAlias', {
+      aliasName: 'live',
+      version: bedrockKnowledgeBaseLambda.currentVersion,
+      provisionedConcurrentExecutions: 2,
+    });
+
     // Create role for the payload utility Lambda
     const payloadUtilsRole = new iam.Role(this, 'PayloadUtilsRole', {
       assumedBy: new iam.ServicePrincipal('lambda.amazonaws.com'),
@@ -589,7 +624,8 @@ export class DocumentProcessingCdkStack extends cdk.Stack {
 
     // Define the Bedrock knowledge base task
     const bedrockTask = new tasks.LambdaInvoke(this, 'AddToBedrockKnowledgeBase', {
-      lambdaFunction: bedrockKnowledgeBaseLambda,
+      // Invoke through the alias so calls land on the provisioned (warm) pool
+      lambdaFunction: bedrockKnowledgeBaseAlias,
       // Use the entire input as the payload, but don't set payloadResponseOnly
       // This ensures the response has the standard Lambda Invoke structure with Payload field
     });
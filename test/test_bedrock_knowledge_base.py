@@ -0,0 +1,108 @@
+import io
+import json
+import os
+import importlib.util
+
+import pytest
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+# Dynamically load the bedrock-knowledge-base module
+MODULE_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../lambda/bedrock-knowledge-base.py')
+)
+spec = importlib.util.spec_from_file_location("bedrock_knowledge_base", MODULE_PATH)
+bedrock_knowledge_base = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bedrock_knowledge_base)
+
+
+def stream_extract(document):
+    return bedrock_knowledge_base.stream_extract_document(
+        io.BytesIO(json.dumps(document).encode('utf-8'))
+    )
+
+# Tests for stream_extract_document
+
+
+@pytest.mark.skipif(bedrock_knowledge_base.ijson is None, reason='ijson not bundled')
+def test_stream_extract_collects_metadata_after_text_field():
+    text, metadata = stream_extract({
+        'document_content': {'text_content': 'hello world'},
+        'metadata': {'title': 'Spec Sheet', 'page_count': '3'},
+    })
+    assert text == 'hello world'
+    assert metadata == {'title': 'Spec Sheet', 'page_count': '3'}
+
+
+@pytest.mark.skipif(bedrock_knowledge_base.ijson is None, reason='ijson not bundled')
+def test_stream_extract_falls_back_to_document_metadata():
+    text, metadata = stream_extract({
+        'text_content': 'hello world',
+        'document_metadata': {'title': 'Spec Sheet'},
+    })
+    assert text == 'hello world'
+    assert metadata == {'title': 'Spec Sheet'}
+
+
+def score(query_terms, value_lower, index_type, index=None, query_phrase=None):
+    return bedrock_knowledge_base.calculate_image_relevance(
+        query_terms, value_lower, index_type, index, query_phrase=query_phrase
+    )
+
+# Tests for tokenize_lower
+
+
+def test_tokenize_lower_trims_edge_punctuation():
+    assert bedrock_knowledge_base.tokenize_lower('what is the pump capacity?') == \
+        ['what', 'is', 'the', 'pump', 'capacity']
+
+
+def test_tokenize_lower_keeps_inner_punctuation():
+    assert bedrock_knowledge_base.tokenize_lower('state-of-the-art pump') == \
+        ['state-of-the-art', 'pump']
+
+# Tests for calculate_image_relevance
+
+
+def test_qa_question_match_survives_trailing_punctuation():
+    relevance, matched = score(
+        ['capacity'], 'pump specifications', 'qa_image',
+        {'question': 'What is the pump capacity?', 'answer': '500 GPM'}
+    )
+    assert relevance >= 10
+    assert 'capacity' in matched
+
+
+def test_value_match_survives_trailing_punctuation():
+    relevance, matched = score(['motor'], 'the motor, is large', 'embedded_image')
+    assert matched == {'motor'}
+    assert relevance > 0
+
+
+def test_single_term_query_gets_phrase_boost():
+    relevance, matched = score(['motor'], 'the motor is large', 'embedded_image')
+    assert matched == {'motor'}
+    # type weight 3 + density 1/(4+1)*5 + single-term phrase boost 1*2
+    assert relevance == 6.0
+
+# Tests for calculate_image_relevance_batch
+
+
+@pytest.mark.skipif(bedrock_knowledge_base.np is None,
+                    reason='NumPy not bundled; batch path delegates to the scalar scorer')
+def test_batch_scorer_matches_scalar_scorer():
+    values = [
+        f'the motor, pump! assembly row {i}' if i % 3 else f'unrelated text {i}'
+        for i in range(40)
+    ]
+    types = ['embedded_image' if i % 2 else 'image_content' for i in range(40)]
+    query_terms = ['motor', 'pump']
+
+    batch_scores, batch_matched = bedrock_knowledge_base.calculate_image_relevance_batch(
+        query_terms, values, types
+    )
+    for value, index_type, batch_score, batch_terms in zip(
+            values, types, batch_scores, batch_matched):
+        scalar_score, scalar_terms = score(query_terms, value, index_type)
+        assert batch_score == pytest.approx(scalar_score)
+        assert batch_terms == scalar_terms
@@ -0,0 +1,68 @@
+import json
+import os
+import importlib.util
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+# Dynamically load the metadata-extractor module
+MODULE_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../lambda/metadata-extractor.py')
+)
+spec = importlib.util.spec_from_file_location("metadata_extractor", MODULE_PATH)
+metadata_extractor = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(metadata_extractor)
+
+
+class RecordingTable:
+    """Stands in for a DynamoDB table and records stored items."""
+
+    def __init__(self):
+        self.items = []
+
+    def put_item(self, Item):
+        self.items.append(Item)
+
+
+def put_item(item):
+    table = RecordingTable()
+    metadata_extractor.put_search_index_item(table, item)
+    return table.items[0]
+
+# Tests for put_search_index_item
+
+
+def test_put_search_index_item_stores_derived_attributes():
+    stored = put_item({'id': 'doc1_title', 'index_value': 'Pump Capacity Rating'})
+    assert stored['index_tokens'] == {'pump', 'capacity', 'rating'}
+    assert stored['index_value_lower'] == 'pump capacity rating'
+    assert stored['text_content_preview'] == 'Pump Capacity Rating'
+
+
+def test_put_search_index_item_trims_token_punctuation():
+    stored = put_item({'id': 'doc1_q', 'index_value': 'What is the pump capacity?'})
+    assert 'capacity' in stored['index_tokens']
+    assert 'capacity?' not in stored['index_tokens']
+
+
+def test_put_search_index_item_truncates_long_preview():
+    stored = put_item({'id': 'doc1_body', 'index_value': 'x' * 150})
+    assert stored['text_content_preview'] == 'x' * 100 + '...'
+
+
+def test_put_search_index_item_does_not_mutate_caller_item():
+    item = {'id': 'doc1_title', 'index_value': 'Pump Capacity Rating'}
+    original = dict(item)
+    put_item(item)
+    assert item == original
+
+
+def test_handler_response_with_indexed_items_is_json_serializable():
+    # The handler appends the same dicts it indexes to search_indices and
+    # embeds them in response_data, so they must survive json.dumps
+    table = RecordingTable()
+    search_indices = []
+    for value in ['Pump Capacity Rating', 'Motor Assembly Diagram']:
+        item = {'id': f'doc1_{value[:4].lower()}', 'index_value': value}
+        metadata_extractor.put_search_index_item(table, item)
+        search_indices.append(item)
+    json.dumps({'statusCode': 200, 'search_indices': search_indices})